@@ -13,7 +13,7 @@ setuptools.setup(
     install_requires=['flask>=2.0.1', 'requests>=2.28.2', 'logzero', 'Flask-SocketIO==4.3.1', 'fire',
                       'python-engineio==3.13.2', 'python-socketio==4.6.0', 'Werkzeug==2.0.3',
                       'Jinja2==3.0.1','tidevice==0.9.7', 'tqdm', 'xlwt','pyfiglet','psutil',
-                      'opencv-python'],
+                      'opencv-python', 'numpy'],
     version=__version__,
     long_description=long_description,
     python_requires='>=3.10',
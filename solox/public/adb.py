@@ -7,15 +7,18 @@
 @Desc    :  adb line.
 @Update  :  2022/7/14 by Rafa chen
 """
+import atexit
 import os
 import platform
 import queue
+import re
 import stat
 import subprocess
 import threading
 import time
-
-import select
+import uuid
+from logzero import logger
+from solox.public.adbclient import AdbClient, AdbError, ShellResult
 
 STATICPATH = os.path.dirname(os.path.realpath(__file__))
 DEFAULT_ADB_PATH = {
@@ -75,54 +78,225 @@ def builtin_adb_path():
     return adb_path
 
 
+class ShellSession(object):
+    """A long-lived `adb shell` process that runs framed commands one at a time"""
+
+    def __init__(self, adb_path, deviceId=None, timeout=10):
+        self.adb_path = adb_path
+        self.deviceId = deviceId
+        self.timeout = timeout
+        self.process = None
+        self.lines = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """Start the adb shell process and the thread draining its stdout"""
+        args = [self.adb_path]
+        if self.deviceId:
+            args += ['-s', self.deviceId]
+        args.append('shell')
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, bufsize=0)
+        self.lines = queue.Queue()
+        reader = threading.Thread(target=self._read_output, args=(self.process.stdout, self.lines))
+        reader.daemon = True
+        reader.start()
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.kill()
+                self.process.wait(timeout=1)
+            except Exception:
+                pass
+            self.process = None
+
+    def execute(self, cmd, timeout=None):
+        """
+        Run a command in the session and wait for its sentinel line
+        :param cmd: command line interpreted by the device shell
+        :param timeout: seconds to wait before the session is killed
+        :return: (exit code, stdout)
+        """
+        timeout = timeout or self.timeout
+        sentinel = '__SOLOX_{}__'.format(uuid.uuid4().hex)
+        # stdin is detached so that a command can never swallow the next frame
+        frame = '{{ {}\n}} </dev/null 2>/dev/null; __solox_rc=$?; echo; echo {}$__solox_rc\n'.format(cmd, sentinel)
+        with self.lock:
+            if not self.alive():
+                self.connect()
+            try:
+                self.process.stdin.write(frame.encode('utf-8'))
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError):
+                self.close()
+                self.connect()
+                self.process.stdin.write(frame.encode('utf-8'))
+                self.process.stdin.flush()
+            output = []
+            deadline = time.time() + timeout
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.close()
+                    raise TimeoutError('adb shell timeout after {}s: {}'.format(timeout, cmd))
+                try:
+                    line = self.lines.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+                if line is None:
+                    self.close()
+                    raise ConnectionError('adb shell session closed: {}'.format(self.deviceId))
+                text = line.decode('utf-8', errors='replace')
+                if text.startswith(sentinel):
+                    code = text[len(sentinel):].strip()
+                    return int(code) if code.isdigit() else -1, ''.join(output)
+                output.append(text)
+
+    @staticmethod
+    def _read_output(stdout, lines):
+        for line in iter(stdout.readline, b''):
+            lines.put(line)
+        lines.put(None)
+
+
+class ShellSessionPool(object):
+    """A few persistent shell sessions per deviceId, dumpsys and other slow services run on their own lane"""
+    SIZE = 2
+    SLOW_COMMANDS = ('dumpsys', 'pm', 'am', 'screencap')
+    # shell keywords that can precede the program of a segment, as in 'for ...; do dumpsys ...; done'
+    KEYWORDS = ('do', 'then', 'else', 'elif', 'while', 'until', 'if', '!', '{', '(', 'exec', 'time')
+
+    def __init__(self, adb_path, timeout=10, size=SIZE):
+        self.adb_path = adb_path
+        self.timeout = timeout
+        self.size = size
+        # (deviceId, lane): [ShellSession]
+        self.sessions = {}
+        self.turns = {}
+        self.lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            # sessions belong to the process that started them, forked workers open their own
+            os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.close)
+
+    def _reset(self):
+        self.sessions = {}
+        self.turns = {}
+        self.lock = threading.Lock()
+
+    def lane(self, cmd):
+        """short reads never wait behind a system service dump, judged by the program of each command segment"""
+        for segment in re.split(r'&&|\|\||[;|&\n]', cmd):
+            words = segment.split()
+            # skip keywords and variable assignments in front of the program
+            while words and (words[0] in self.KEYWORDS or re.match(r'\w+=', words[0])):
+                words.pop(0)
+            if words and os.path.basename(words[0]) in self.SLOW_COMMANDS:
+                return 'slow'
+        return 'fast'
+
+    def get(self, deviceId, lane='fast'):
+        with self.lock:
+            key = (deviceId, lane)
+            sessions = self.sessions.setdefault(key, [])
+            for session in sessions:
+                if not session.lock.locked():
+                    return session
+            if len(sessions) < self.size:
+                session = ShellSession(self.adb_path, deviceId, self.timeout)
+                sessions.append(session)
+                return session
+            # every session is busy, queue behind them in turn
+            self.turns[key] = (self.turns.get(key, -1) + 1) % len(sessions)
+            return sessions[self.turns[key]]
+
+    def execute(self, deviceId, cmd, timeout=None):
+        # a timeout only kills the session that ran the command, the other ones of the device keep going
+        session = self.get(deviceId, self.lane(cmd))
+        try:
+            return session.execute(cmd, timeout)
+        except ConnectionError:
+            # the device dropped or the shell exited, retry once on a fresh session
+            return session.execute(cmd, timeout)
+
+    def close(self, deviceId=None):
+        with self.lock:
+            targets = [key for key in self.sessions if deviceId is None or key[0] == deviceId]
+            for key in targets:
+                for session in self.sessions.pop(key):
+                    session.close()
+                self.turns.pop(key, None)
+
+
 class ADB(object):
 
     def __init__(self):
         self.adb_path = builtin_adb_path()
-        self.process = None
-        self.command_queue = queue.Queue()
-        self.running = True
-        self.lock = threading.Lock()
-        self.result_threading = threading.Thread(target=self._read_output)
-        self.result_threading.daemon = True
-
-    def adb_new_shell(self, cmd, deviceId):
-        response_event = threading.Event()
-        response_data = {'event': response_event, 'output': []}
-
-        with self.lock:  # ʹȷ̰߳ȫ
-            if self.process is None:
-                # ûн̣һµADB Shell
-                self.process = subprocess.Popen([self.adb_path, '-s', deviceId, 'shell'],
-                                                stdin=subprocess.PIPE,
-                                                stdout=subprocess.PIPE,
-                                                stderr=subprocess.PIPE,
-                                                bufsize=0,  # л
-                                                universal_newlines=True,
-                                                text=True)
-                self.result_threading.start()  # ̶߳ȡ
-
-            # д
-            self.process.stdin.write(cmd + '\n')
-            self.process.stdin.flush()
-            self.command_queue.put(response_data)
-
-        # ȴ
-        response_event.wait()
-        output = response_data['output']
-        return output  # 
-
-    def shell(self, cmd, deviceId):
-        run_cmd = f'{self.adb_path} -s {deviceId} shell {cmd}'
-        result = subprocess.Popen(run_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()[
-            0].decode("utf-8").strip()
+        self.pool = ShellSessionPool(self.adb_path)
+        self.client = AdbClient()
+        self.native = None
+
+    def server_available(self):
+        """Whether the adb server answers on its smart socket, started once if needed"""
+        if self.native is None:
+            self.native = self.client.available()
+            if not self.native:
+                try:
+                    subprocess.run([self.adb_path, 'start-server'], stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL)
+                    self.native = self.client.available()
+                except OSError as e:
+                    # no runnable adb binary, commands go through the adb command line
+                    logger.warning(e)
+                    self.native = False
+        return self.native
+
+    def shell(self, cmd, deviceId, timeout=None):
+        try:
+            result = self.pool.execute(deviceId, cmd, timeout)[1].strip()
+        except (TimeoutError, ConnectionError, OSError) as e:
+            logger.warning(e)
+            result = ''
         return result
 
+    def run(self, cmd, deviceId, timeout=None):
+        """
+        Run a one-off command without forking the adb binary
+        :return: ShellResult(exit_code, stdout, stderr)
+        """
+        if self.server_available():
+            try:
+                return self.client.shell(deviceId, cmd, timeout)
+            except (AdbError, OSError) as e:
+                logger.warning(e)
+        try:
+            exit_code, stdout = self.pool.execute(deviceId, cmd, timeout)
+        except (TimeoutError, ConnectionError, OSError) as e:
+            logger.warning(e)
+            exit_code, stdout = -1, ''
+        return ShellResult(exit_code, stdout, '')
+
+    def devices(self):
+        """Return [(serial, state)] of all devices known to the adb server"""
+        if self.server_available():
+            try:
+                return self.client.devices()
+            except (AdbError, OSError) as e:
+                logger.warning(e)
+        output = subprocess.run([self.adb_path, 'devices'], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL).stdout.decode('utf-8', errors='replace')
+        return AdbClient.parse_devices('\n'.join(output.splitlines()[1:]))
+
+    def track_devices(self):
+        """Yield the device list on every change, see AdbClient.track_devices"""
+        return self.client.track_devices()
+
     def new_shell(self, cmd):
-        run_cmd = f'{self.adb_path} shell {cmd}'
-        result = subprocess.Popen(run_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()[
-            0].decode("utf-8").strip()
-        return result
+        return self.shell(cmd, deviceId=None)
 
     def tcp_shell(self, deviceId, cmd):
         run_cmd = f'{self.adb_path} -s {deviceId} {cmd}'
@@ -134,76 +308,8 @@ class ADB(object):
         result = os.system(run_cmd)
         return result
 
-    def close_shell(self):
-        with self.lock:
-            self.running = False
-            if self.process:
-                self.process.terminate()
-                self.process = None
-
-    def _read_output(self):
-        start_time = time.time()
-        out_put_list = ''
-        while self.running:
-            for line in iter(self.process.stdout.readline, b''):
-                out_put_list += line
-                print(out_put_list)
-            print("woc")
-            if out_put_list.__len__() > 0:
-                with self.lock:
-                    if not self.command_queue.empty():
-                        response_data = self.command_queue.get()
-                        response_data['output'] = out_put_list
-                        response_data['event'].set()
-                        out_put_list = ''
-            elif (time.time() - start_time) > 2:
-                response_data['event'].set()
-                break
+    def close_shell(self, deviceId=None):
+        self.pool.close(deviceId)
 
 
 adb = ADB()
-
-
-class ADBShell:
-    def __init__(self):
-        self.process = None
-        self.output_queue = queue.Queue()
-        self.thread = threading.Thread(target=self._read_output)
-        self.adb_path = builtin_adb_path()
-
-    def _read_output(self):
-        while True:
-            line = self.process.stdout.readline()
-            if line:
-                self.output_queue.put(line)
-            else:
-                break
-
-    def send_command(self, command, deviceId):
-        if self.process is None:
-            self.process = subprocess.Popen([self.adb_path, '-s', deviceId, 'shell'], stdin=subprocess.PIPE,
-                                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                            text=True)
-            self.thread.daemon = True
-            self.thread.start()
-        self.process.stdin.write(command + '\n')
-        self.process.stdin.flush()
-        output = []
-        while True:
-            try:
-                line = self.output_queue.get(timeout=1)
-                if line.endswith('$ '):  # shellʾ'# '
-                    break
-                output.append(line.strip())
-            except queue.Empty:
-                break
-        return '\n'.join(output)
-
-    def close(self):
-        self.process.stdin.write('exit\n')
-        self.process.stdin.flush()
-        self.process.terminate()
-        self.thread.join()
-
-
-adb_shell = ADBShell()
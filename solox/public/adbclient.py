@@ -0,0 +1,178 @@
+#!/usr/bin/python
+# encoding=utf-8
+
+"""
+@Desc    :  pure python client for the adb host protocol (smart socket on port 5037).
+"""
+import os
+import socket
+import struct
+from collections import namedtuple
+
+ShellResult = namedtuple('ShellResult', ['exit_code', 'stdout', 'stderr'])
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = int(os.environ.get('ANDROID_ADB_SERVER_PORT', 5037))
+
+# shell protocol v2 packet ids
+ID_STDIN = 0
+ID_STDOUT = 1
+ID_STDERR = 2
+ID_EXIT = 3
+ID_CLOSE_STDIN = 4
+
+
+class AdbError(Exception):
+    """The adb server answered FAIL or the stream broke"""
+
+
+class AdbClient(object):
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.shell_v2 = {}
+
+    def connect(self, timeout=None):
+        """Open a socket to the adb server"""
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=timeout or self.timeout)
+        except OSError as e:
+            raise AdbError('adb server is not reachable on {}:{}: {}'.format(self.host, self.port, e))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def send(sock, payload):
+        data = payload.encode('utf-8')
+        sock.sendall('{:04x}'.format(len(data)).encode('ascii') + data)
+
+    @staticmethod
+    def read_exact(sock, size):
+        chunks = []
+        while size > 0:
+            chunk = sock.recv(size)
+            if not chunk:
+                raise AdbError('connection closed by adb server')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def read_string(self, sock):
+        size = int(self.read_exact(sock, 4), 16)
+        return self.read_exact(sock, size).decode('utf-8', errors='replace')
+
+    def check_status(self, sock):
+        status = self.read_exact(sock, 4)
+        if status == b'OKAY':
+            return
+        if status == b'FAIL':
+            raise AdbError(self.read_string(sock))
+        raise AdbError('unexpected adb server status: {}'.format(status))
+
+    def request(self, payload):
+        """Send a host service request and return its length-prefixed answer"""
+        with self.connect() as sock:
+            self.send(sock, payload)
+            self.check_status(sock)
+            return self.read_string(sock)
+
+    def version(self):
+        return int(self.request('host:version'), 16)
+
+    def available(self):
+        try:
+            self.version()
+            return True
+        except (AdbError, ValueError):
+            return False
+
+    @staticmethod
+    def parse_devices(text):
+        devices = []
+        for line in text.splitlines():
+            fields = line.split()
+            if len(fields) >= 2:
+                devices.append((fields[0], fields[1]))
+        return devices
+
+    def devices(self):
+        """Return [(serial, state)] of every device known to the server"""
+        return self.parse_devices(self.request('host:devices'))
+
+    def track_devices(self):
+        """Yield the full device list each time the server reports a change"""
+        sock = self.connect()
+        sock.settimeout(None)
+        try:
+            self.send(sock, 'host:track-devices')
+            self.check_status(sock)
+            while True:
+                yield self.parse_devices(self.read_string(sock))
+        finally:
+            sock.close()
+
+    def transport(self, serial, timeout=None):
+        """Open a socket bound to one device"""
+        sock = self.connect(timeout)
+        try:
+            self.send(sock, 'host:transport:{}'.format(serial) if serial else 'host:transport-any')
+            self.check_status(sock)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def features(self, serial):
+        return self.request('host-serial:{}:features'.format(serial)).split(',')
+
+    def shell(self, serial, cmd, timeout=None):
+        """
+        Run a command on the device
+        :param serial: device id, None picks the only device
+        :param cmd: command line interpreted by the device shell
+        :return: ShellResult(exit_code, stdout, stderr); exit_code is None on devices without shell v2
+        """
+        if serial not in self.shell_v2:
+            try:
+                self.shell_v2[serial] = 'shell_v2' in self.features(serial)
+            except AdbError:
+                self.shell_v2[serial] = False
+        with self.transport(serial, timeout) as sock:
+            if self.shell_v2[serial]:
+                self.send(sock, 'shell,v2,raw:{}'.format(cmd))
+                self.check_status(sock)
+                return self.read_shell_v2(sock)
+            self.send(sock, 'shell:{}'.format(cmd))
+            self.check_status(sock)
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            return ShellResult(None, b''.join(chunks).decode('utf-8', errors='replace'), '')
+
+    def read_shell_v2(self, sock):
+        stdout, stderr = [], []
+        exit_code = None
+        while exit_code is None:
+            try:
+                header = self.read_exact(sock, 5)
+            except AdbError:
+                break
+            packet_id, size = struct.unpack('<BI', header)
+            data = self.read_exact(sock, size) if size else b''
+            if packet_id == ID_STDOUT:
+                stdout.append(data)
+            elif packet_id == ID_STDERR:
+                stderr.append(data)
+            elif packet_id == ID_EXIT:
+                exit_code = data[0] if data else 0
+        return ShellResult(exit_code,
+                           b''.join(stdout).decode('utf-8', errors='replace'),
+                           b''.join(stderr).decode('utf-8', errors='replace'))
+
+
+client = AdbClient()
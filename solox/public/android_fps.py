@@ -1,28 +1,162 @@
 # -*- coding: utf-8 -*-
+import bisect
 import datetime
 import queue
 import re
+import shlex
 import threading
 import time
 import traceback
+from array import array
 from logzero import logger
+from solox.public import frame_analysis
 from solox.public.adb import adb
 from solox.public.common import Devices
 from solox.public.base.monitor import Monitor
 
 d = Devices()
 
-collect_fps = 0
-collect_jank = 0
-collect_bigjank = 0
-collect_jank_time = 0
-collect_Stutter = 0
-first_collect_time = 0
-this_jank_time = 0
+
+class FPSSession(object):
+    """FPS/jank results and stutter accumulators of one (device, package, window) measurement"""
+    _instances = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, device, package_name, window=None):
+        with cls._lock:
+            key = (device, package_name, window)
+            if key not in cls._instances:
+                cls._instances[key] = cls(device, package_name, window)
+            return cls._instances[key]
+
+    @classmethod
+    def clear_all(cls):
+        with cls._lock:
+            for session in cls._instances.values():
+                session.reset()
+            cls._instances.clear()
+
+    def __init__(self, device, package_name, window=None):
+        self.device = device
+        self.package_name = package_name
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.fps = 0
+        self.jank = 0
+        self.bigjank = 0
+        self.jank_time = 0
+        self.stutter = 0
+        self.first_collect_time = 0
+        self.this_jank_time = 0
+
+    def result(self):
+        return self.fps, self.jank, self.bigjank, self.jank_time, self.stutter
+
+    def add_jank_time(self, jank_time, collect_time):
+        """Accumulate jank time and return the stutter: session jank time over a 600 (or 1200) second window"""
+        times = 1
+        if self.first_collect_time == 0:
+            self.first_collect_time = collect_time
+        all_collect_time = collect_time - self.first_collect_time
+        self.this_jank_time = self.this_jank_time + jank_time
+        if all_collect_time == 0:
+            return 0
+        if all_collect_time / 600 > times:
+            times += 1
+        return self.this_jank_time / (600 * times)
+
+
+class LayerResolver(object):
+    """SurfaceFlinger layer of a package, cached until its latency data goes stale or the focused window changes"""
+    FOCUS_CHECK_INTERVAL = 2.0
+    _instances = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, device, package_name):
+        with cls._lock:
+            key = (device, package_name)
+            if key not in cls._instances:
+                cls._instances[key] = cls(device, package_name)
+            return cls._instances[key]
+
+    @classmethod
+    def clear_all(cls):
+        with cls._lock:
+            cls._instances.clear()
+
+    def __init__(self, device, package_name):
+        self.device = device
+        self.package_name = package_name
+        self.layer = None
+        self.focus = None
+        self.focus_checked = 0
+
+    def candidates(self):
+        """layer names worth trying, from one --list: the surfaceview of the package first, then its activity"""
+        lines = adb.shell(cmd='dumpsys SurfaceFlinger --list | grep {}'.format(self.package_name),
+                          deviceId=self.device).split('\n')
+        lines = [line.strip() for line in lines if line.find(self.package_name) != -1]
+        surfaceviews = [line for line in lines if line.startswith('SurfaceView')]
+        names = []
+        blast = [line for line in surfaceviews if line.find('BLAST') != -1]
+        if blast:
+            names.append(blast[0])
+        elif surfaceviews:
+            names.append(surfaceviews[-1])
+        elif lines:
+            names.append('SurfaceView ' + lines[-1])
+        if surfaceviews:
+            activity_line = surfaceviews[0]
+            if activity_line.find(' ') != -1 and len(activity_line.split(' ')) > 2:
+                names.append(activity_line.split(' ')[2])
+            else:
+                names.append(activity_line.replace('SurfaceView', '').replace('[', '').replace(']', '')
+                             .replace('-', '').strip())
+        elif lines:
+            names.append(lines[-1])
+        return [name for index, name in enumerate(names) if name and name not in names[:index]]
+
+    def resolve(self, read):
+        """
+        Read the latency data of the cached layer, looking the layer up again only when that read is stale
+        :param read: callable(layer) returning the latency lines, None when the layer has no usable data
+        :return: latency lines or None
+        """
+        if self.layer is not None:
+            results = read(self.layer)
+            if results is not None:
+                return results
+            logger.debug('latency of {} went stale, resolving the layer again'.format(self.layer))
+        self.layer = None
+        for name in self.candidates():
+            results = read(name)
+            if results is not None:
+                self.layer = name
+                return results
+        return None
+
+    def focus_changed(self):
+        """cheap focused window check, at most once per FOCUS_CHECK_INTERVAL, drops the cached layer on a change"""
+        if time.monotonic() - self.focus_checked < self.FOCUS_CHECK_INTERVAL:
+            return False
+        self.focus_checked = time.monotonic()
+        focus = adb.shell(cmd='dumpsys window | grep mCurrentFocus', deviceId=self.device).strip()
+        changed = self.focus is not None and focus != self.focus
+        self.focus = focus
+        if changed:
+            logger.info('focused window changed to {}'.format(focus))
+            self.layer = None
+        return changed
 
 
 class SurfaceStatsCollector(object):
-    def __init__(self, device, frequency, package_name, fps_queue, jank_threshold, surfaceview, use_legacy=False):
+    def __init__(self, device, frequency, package_name, fps_queue, jank_threshold, surfaceview, use_legacy=False,
+                 session=None):
+        self.session = session or FPSSession.get(device, package_name)
         self.device = device
         self.frequency = frequency
         self.package_name = package_name
@@ -35,6 +169,9 @@ class SurfaceStatsCollector(object):
         self.focus_window = None
         self.surfaceview = surfaceview
         self.fps_queue = fps_queue
+        # every framestats column of the last gfxinfo read, when surfaceview is off
+        self.framestats = None
+        self.layers = LayerResolver.get(device, package_name)
         # print(self.frequency, " ---------------------------- ")
 
     def start(self, start_time):
@@ -66,63 +203,11 @@ class SurfaceStatsCollector(object):
             if self.fps_queue:
                 self.fps_queue.task_done()
 
-    def get_surfaceview(self):
-        activity_line = ''
-        try:
-            dumpsys_result = adb.shell(cmd='dumpsys SurfaceFlinger --list | {} {}'.format(d.filterType(), self.package_name), deviceId=self.device)
-            dumpsys_result_list = dumpsys_result.split('\n')
-            for line in dumpsys_result_list:
-                if line.startswith('SurfaceView') and line.find(self.package_name) != -1:
-                    activity_line = line.strip()
-                    # activity_list.append(activity_line)
-                    if line.startswith('SurfaceView') and line.find(self.package_name) != -1 and line.find('BLAST') != -1:
-                        activity_line = line.strip()
-                        # print(activity_line)
-                        return activity_line
-            if activity_line == '':
-                for line in dumpsys_result_list:
-                    if line.find(self.package_name) != -1:
-                        activity_line = line.strip()
-            # print(activity_line)
-            return activity_line
-
-        except Exception:
-            traceback.print_exc()
-            logger.error('get activity name failed, Please provide SurfaceFlinger --list information to the author')
-            logger.info('dumpsys SurfaceFlinger --list info: {}'.format(dumpsys_result))
-        pass
-
-    def get_surfaceview_activity(self):
-        activity_name = ''
-        activity_line = ''
-        try:
-            dumpsys_result = adb.shell(cmd='dumpsys SurfaceFlinger --list | {} {}'.format(d.filterType(), self.package_name), deviceId=self.device)
-            dumpsys_result_list = dumpsys_result.split('\n')
-            for line in dumpsys_result_list:
-                if line.startswith('SurfaceView') and line.find(self.package_name) != -1:
-                    activity_line = line.strip()
-                    break
-            if activity_line:
-                if activity_line.find(' ')  != -1:
-                    activity_name = activity_line.split(' ')[2]
-                else:
-                    activity_name = activity_line.replace('SurfaceView','').replace('[','').replace(']','').replace('-','').strip()
-            else:
-                activity_name = dumpsys_result_list[len(dumpsys_result_list) - 1]
-                if not activity_name.__contains__(self.package_name):
-                    logger.error('get activity name failed, Please provide SurfaceFlinger --list information to the author')
-                    logger.info('dumpsys SurfaceFlinger --list info: {}'.format(dumpsys_result))
-        except Exception:
-            traceback.print_exc()
-            logger.error('get activity name failed, Please provide SurfaceFlinger --list information to the author')
-            logger.info('dumpsys SurfaceFlinger --list info: {}'.format(dumpsys_result))
-        return activity_name
-
      # 明天测试一下这个id
     def get_focus_activity(self):
         activity_name = ''
         activity_line = ''
-        dumpsys_result = adb.shell(cmd='dumpsys window windows', deviceId=self.device)
+        dumpsys_result = adb.shell(cmd='dumpsys window windows | grep mCurrentFocus', deviceId=self.device)
         dumpsys_result_list = dumpsys_result.split('\n')
         for line in dumpsys_result_list:
             if line.find('mCurrentFocus') != -1:
@@ -137,7 +222,9 @@ class SurfaceStatsCollector(object):
             else:
                 activity_name = activity_line_split[1]
         if not activity_name:
-            activity_name = self.get_surfaceview_activity()
+            # the activity name parsed out of the SurfaceFlinger layers of the package
+            candidates = self.layers.candidates()
+            activity_name = candidates[-1] if candidates else ''
         return activity_name
 
     def get_foreground_process(self):
@@ -169,17 +256,9 @@ class SurfaceStatsCollector(object):
         return fps, jank, bigjank
 
     def _calculate_results_new(self, refresh_period, timestamps, collect_time):
-        global first_collect_time
-        global this_jank_time
-
-        # 计算卡顿率的倍数
-        times = 1
-        if first_collect_time == 0:
-             first_collect_time = collect_time
-        # print(first_collect_time, "第一次收集时间")
+        session = self.session
         # print(timestamps, "我猜是这个数组有问题")
         frame_count = len(timestamps)
-        first_time = first_collect_time
         if frame_count == 0:
             fps = 0
             jank = 0
@@ -206,23 +285,14 @@ class SurfaceStatsCollector(object):
             seconds = timestamps[-1][0] - timestamps[0][0]
             if seconds > 0:
                 fps = round((frame_count - 1) / seconds, 2)
-                jank, bigjank, jank_time = self._calculate_jankey_new(timestamps)
+                jank, bigjank, jank_time = frame_analysis.jank_stats([timestamp[1] for timestamp in timestamps],
+                                                                     self.jank_threshold)
             else:
                 fps = 1
                 jank = 0
                 bigjank = 0
                 jank_time = 0
-        all_collect_time = collect_time-first_time
-        this_jank_time = this_jank_time + jank_time
-        if all_collect_time == 0:
-            Stutter = 0
-        elif all_collect_time/600 <= times:
-            Stutter = (this_jank_time / (600 * times))
-        elif all_collect_time/600 > times:
-            times += 1
-            Stutter = (this_jank_time / (600 * times))
-        else:
-            Stutter = (this_jank_time / all_collect_time)
+        Stutter = session.add_jank_time(jank_time, collect_time)
         # print(Stutter, this_jank_time, "卡顿率，总卡顿时间")
         return fps, jank, bigjank, jank_time, Stutter
 
@@ -288,11 +358,7 @@ class SurfaceStatsCollector(object):
         计算数据线程
     '''
     def _calculator_thread(self, start_time):
-        global collect_fps
-        global collect_jank
-        global collect_bigjank
-        global collect_jank_time
-        global collect_Stutter
+        session = self.session
         while True:
             try:
                 data = self.data_queue.get()
@@ -310,7 +376,7 @@ class SurfaceStatsCollector(object):
                         fps = 60
                     self.surface_before = data
                     # logger.debug('FPS:%2s'%fps)
-                    collect_fps = fps
+                    session.fps = fps
                 else:
                     refresh_period = data[0]
                     timestamps = data[1]
@@ -318,11 +384,11 @@ class SurfaceStatsCollector(object):
                     # fps,jank = self._calculate_results(refresh_period, timestamps)
                     fps, jank, bigjank, jank_time, Stutter = self._calculate_results_new(refresh_period, timestamps,collect_time)
                     # logger.debug('FPS:%2s Jank:%s'%(fps,jank))
-                    collect_fps = fps
-                    collect_jank = jank
-                    collect_bigjank = bigjank
-                    collect_jank_time = jank_time
-                    collect_Stutter = Stutter
+                    session.fps = fps
+                    session.jank = jank
+                    session.bigjank = bigjank
+                    session.jank_time = jank_time
+                    session.stutter = Stutter
                     # print(collect_Stutter, "最终计算")
                 time_consume = time.time() - before
                 delta_inter = self.frequency - time_consume
@@ -351,7 +417,8 @@ class SurfaceStatsCollector(object):
                     timestamps = []
                     refresh_period, new_timestamps = self._get_surfaceflinger_frame_data()
                     if refresh_period is None or new_timestamps is None:
-                        self.focus_window = self.get_focus_activity()
+                        if self.surfaceview is not True:
+                            self.focus_window = self.get_focus_activity()
                         logger.warning("refresh_period is None or timestamps is None")
                         continue
                     timestamps += [timestamp for timestamp in new_timestamps
@@ -364,10 +431,14 @@ class SurfaceStatsCollector(object):
                         is_first = False
                     else:
                         is_first = True
-                        cur_focus_window = self.get_focus_activity()
-                        if self.focus_window != cur_focus_window:
-                            self.focus_window = cur_focus_window
-                            continue
+                        if self.surfaceview is True:
+                            if self.layers.focus_changed():
+                                continue
+                        else:
+                            cur_focus_window = self.get_focus_activity()
+                            if self.focus_window != cur_focus_window:
+                                self.focus_window = cur_focus_window
+                                continue
                     self.data_queue.put((refresh_period, timestamps, time.time()))
                     time_consume = time.time() - before
                     delta_inter = self.frequency - time_consume
@@ -460,62 +531,32 @@ class SurfaceStatsCollector(object):
             # results = results.replace("\r\n", "\n").splitlines()
             # refresh_period = int(results[0]) / nanoseconds_per_second
             results = adb.shell(cmd='dumpsys gfxinfo %s framestats' % self.package_name, deviceId=self.device)
-            results = results.replace("\r\n", "\n").splitlines()
             if not len(results):
                 return (None, None)
-            isHaveFoundWindow = False
-            PROFILEDATA_line = 0
-            activity = self.focus_window
-            if self.focus_window.__contains__('#'):
+            windows = frame_analysis.parse_framestats(results)
+            activity = self.focus_window or ''
+            if activity.__contains__('#'):
                 activity = activity.split('#')[0]
-            for line in results:
-                if not isHaveFoundWindow:
-                    if "Window" in line and activity in line:
-                        isHaveFoundWindow = True
-                if not isHaveFoundWindow:
-                    continue
-                if "PROFILEDATA" in line:
-                    PROFILEDATA_line += 1
-                fields = []
-                fields = line.split(",")
-                if fields and '0' == fields[0]:
-                    # https://www.cnblogs.com/zhengna/p/10032078.html
-                    # 1 INTENDED_VSYNC
-                    # 2 VSYNC
-                    # 13 FRAME_COMPLETED
-                    timestamp = [int(fields[1]), int(fields[2]), int(fields[13])]
-                    if timestamp[1] == pending_fence_timestamp:
-                        continue
-                    timestamp = [_timestamp / nanoseconds_per_second for _timestamp in timestamp]
-                    timestamps.append(timestamp)
-                if 2 == PROFILEDATA_line:
-                    break
-        else:
-            # self.focus_window = self.get_surfaceview_activity()
-            self.focus_window = self.get_surfaceview()
-            # print(self.focus_window, "能获取到吗")
-            # com.sanqi.odin.weekly/com.natively.app.MainUnityActivity
-            results = ''
-            if self.focus_window != '':
-                if 'SurfaceView' not in self.focus_window:
-                    self.focus_window = 'SurfaceView ' + self.focus_window
-                    results = adb.shell(
-                        cmd='dumpsys SurfaceFlinger --latency \"%s\"' % self.focus_window, deviceId=self.device)
-                else:
-                    results = adb.shell(
-                        cmd='dumpsys SurfaceFlinger --latency \\"%s\\"' % self.focus_window, deviceId=self.device)
-                    # print('dumpsys SurfaceFlinger --latency {} {}'.format(self.focus_window, self.device))
-            results = results.replace("\r\n", "\n").splitlines()
-            # print(results)
-            if len(results) <= 1 or int(results[-2].split()[0]) ==0:
-                self.focus_window = self.get_surfaceview_activity()
-                results = adb.shell(
-                cmd='dumpsys SurfaceFlinger --latency \\"%s\\"' % self.focus_window, deviceId=self.device)
-                results = results.replace("\r\n", "\n").splitlines()
-
-            if not len(results):
+            window = next((name for name in windows if activity and activity in name), None)
+            if window is None and len(windows) == 1:
+                window = next(iter(windows))
+            if window is None:
                 return (None, None)
-            if not results[0].isdigit():
+            columns = windows[window]
+            self.framestats = columns
+            intended = columns['IntendedVsync']
+            # framestats has no refresh period line, the closest two intended vsyncs are one period apart
+            periods = intended[1:] - intended[:-1]
+            periods = periods[periods > 0]
+            refresh_period = float(periods.min()) / nanoseconds_per_second if len(periods) else 1 / 60
+            # https://www.cnblogs.com/zhengna/p/10032078.html
+            # INTENDED_VSYNC, VSYNC, FRAME_COMPLETED
+            for timestamp in zip(intended.tolist(), columns['Vsync'].tolist(), columns['FrameCompleted'].tolist()):
+                timestamps.append([_timestamp / nanoseconds_per_second for _timestamp in timestamp])
+        else:
+            results = self.layers.resolve(self._read_latency)
+            self.focus_window = self.layers.layer or ''
+            if results is None:
                 return (None, None)
 
             try:
@@ -540,6 +581,19 @@ class SurfaceStatsCollector(object):
 
         return (refresh_period, timestamps)
 
+    def _read_latency(self, layer):
+        """--latency lines of a layer, None when the layer is unknown or only reports empty frames"""
+        results = adb.shell(cmd='dumpsys SurfaceFlinger --latency %s' % shlex.quote(layer), deviceId=self.device)
+        results = results.replace("\r\n", "\n").splitlines()
+        if len(results) <= 1 or not results[0].isdigit():
+            return None
+        try:
+            if int(results[-2].split()[0]) == 0:
+                return None
+        except (IndexError, ValueError):
+            return None
+        return results
+
     def _get_surface_stats_legacy(self):
         """Legacy method (before JellyBean), returns the current Surface index
              and timestamp.
@@ -561,6 +615,263 @@ class SurfaceStatsCollector(object):
             return {'page_flip_count': cur_surface, 'timestamp': timestamp}
         return None
 
+class FrameRingBuffer(object):
+    """Fixed-size ring of frame vsync timestamps in seconds, the oldest frames are overwritten"""
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.data = array('d', bytes(8 * capacity))
+        self.start = 0
+        self.size = 0
+        self.last = 0.0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def extend(self, timestamps):
+        """append the timestamps newer than the last stored one, returns how many were added"""
+        added = 0
+        with self.lock:
+            for timestamp in timestamps:
+                if timestamp <= self.last:
+                    continue
+                self.data[(self.start + self.size) % self.capacity] = timestamp
+                if self.size < self.capacity:
+                    self.size += 1
+                else:
+                    self.start = (self.start + 1) % self.capacity
+                self.last = timestamp
+                added += 1
+        return added
+
+    def window(self, since=None, until=None):
+        """timestamps in [since, until] in order, both ends default to the whole buffer"""
+        with self.lock:
+            end = self.start + self.size
+            if end <= self.capacity:
+                frames = self.data[self.start:end]
+            else:
+                frames = self.data[self.start:] + self.data[:end - self.capacity]
+        lo = 0 if since is None else bisect.bisect_left(frames, since)
+        hi = len(frames) if until is None else bisect.bisect_right(frames, until)
+        return frames[lo:hi]
+
+
+class FrameStreamCollector(object):
+    """Long-running frame collector of one (device, package), polls SurfaceFlinger into a FrameRingBuffer"""
+    IDLE_TIMEOUT = 30
+    _instances = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, device, package_name, surfaceview=True, frequency=0.5):
+        with cls._lock:
+            key = (device, package_name, surfaceview)
+            collector = cls._instances.get(key)
+            created = collector is None or not collector.alive()
+            if created:
+                collector = cls(device, package_name, surfaceview, frequency)
+                cls._instances[key] = collector
+            collector.touched = time.monotonic()
+        # start() runs adb commands, collectors of other devices must not wait for them
+        if created:
+            collector.start()
+        else:
+            collector.ready.wait()
+        return collector
+
+    @classmethod
+    def stop_all(cls):
+        with cls._lock:
+            collectors = list(cls._instances.values())
+            cls._instances.clear()
+        for collector in collectors:
+            collector.stop()
+
+    def __init__(self, device, package_name, surfaceview=True, frequency=0.5, jank_threshold=166, capacity=4096):
+        self.device = device
+        self.package_name = package_name
+        self.frequency = frequency
+        self.buffer = FrameRingBuffer(capacity)
+        self.refresh_period = None
+        self.framestats = []
+        self.last_intended = 0
+        self.collector = SurfaceStatsCollector(device, frequency, package_name, None, jank_threshold, surfaceview,
+                                               session=FPSSession.get(device, package_name))
+        self.stop_event = threading.Event()
+        # set once start() returned, a collector still starting counts as alive
+        self.ready = threading.Event()
+        self.thread = None
+        self.touched = time.monotonic()
+
+    def alive(self):
+        return not self.ready.is_set() or self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        try:
+            try:
+                self.collector.focus_window = self.collector.get_focus_activity()
+            except Exception:
+                logger.warning('Unable to obtain the current activity name for {}'.format(self.package_name))
+            # the first poll runs inline so the first query already sees the last frames SurfaceFlinger kept
+            self.poll()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        finally:
+            self.ready.set()
+
+    def stop(self):
+        self.stop_event.set()
+        # a collector stopped while starting is joined once its thread exists
+        self.ready.wait()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def poll(self):
+        try:
+            refresh_period, timestamps = self.collector._get_surfaceflinger_frame_data()
+        except Exception:
+            logger.debug(traceback.format_exc())
+            return 0
+        if refresh_period is None or timestamps is None:
+            if self.collector.surfaceview is not True:
+                self.collector.focus_window = self.collector.get_focus_activity()
+            return 0
+        self.refresh_period = refresh_period
+        self.keep_framestats(self.collector.framestats)
+        added = self.buffer.extend(timestamp[1] for timestamp in timestamps)
+        if added == 0 and self.collector.surfaceview is True:
+            # no new frame: either a static screen or another window took the focus
+            self.collector.layers.focus_changed()
+        return added
+
+    def keep_framestats(self, columns):
+        """queue the framestats rows not seen yet, framestats repeats the last ~120 frames on every dump"""
+        if not columns:
+            return
+        fresh = columns['IntendedVsync'] > self.last_intended
+        if not fresh.any():
+            return
+        with self.buffer.lock:
+            self.framestats.append({name: values[fresh] for name, values in columns.items()})
+            self.last_intended = int(columns['IntendedVsync'][fresh].max())
+            while sum(len(part['IntendedVsync']) for part in self.framestats) > self.buffer.capacity:
+                self.framestats.pop(0)
+
+    def drain_framestats(self):
+        """framestats columns of the frames collected since the previous drain"""
+        with self.buffer.lock:
+            parts, self.framestats = self.framestats, []
+        return frame_analysis.concat_framestats(parts)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            if time.monotonic() - self.touched > self.IDLE_TIMEOUT:
+                logger.info('fps collector of {} idle, stopped'.format(self.package_name))
+                break
+            before = time.time()
+            self.poll()
+            delta_inter = self.frequency - (time.time() - before)
+            if delta_inter > 0:
+                self.stop_event.wait(delta_inter)
+
+    def stats(self, since=None, until=None, seconds=None):
+        """
+        FPS, jank, big jank and stutter of the frames in a window, without touching the device
+        :param since: device vsync time in seconds, exclusive
+        :param until: device vsync time in seconds, inclusive
+        :param seconds: window length back from the newest frame, used when since is None
+        :return: fps, jank, bigjank, jank_time, stutter, newest frame time in the window
+        """
+        self.touched = time.monotonic()
+        if since is None and seconds is not None:
+            since = self.buffer.last - seconds
+        frames = self.buffer.window(until=until)
+        lo = 0 if since is None else bisect.bisect_right(frames, since)
+        # the frame just before the window anchors the first interval
+        frames = frames[max(lo - 1, 0):]
+        if len(frames) < 2:
+            return 0, 0, 0, 0, 0, self.buffer.last
+        span = frames[-1] - frames[0]
+        fps = round((len(frames) - 1) / span, 2) if span > 0 else 1
+        jank, bigjank, jank_time = frame_analysis.jank_stats(frames, self.collector.jank_threshold)
+        stutter = jank_time / span if span > 0 else 0
+        return fps, jank, bigjank, jank_time, stutter, frames[-1]
+
+
+class TimeStatsCollector(object):
+    """
+    FPS of one (device, package) from SurfaceFlinger timestats (android 10+): SurfaceFlinger accumulates
+    present-to-present histograms itself, each query is one dump and clear so no frame falls between polls
+    """
+    _instances = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, device, package_name):
+        with cls._lock:
+            key = (device, package_name)
+            if key not in cls._instances:
+                collector = cls(device, package_name)
+                collector.start()
+                cls._instances[key] = collector
+            return cls._instances[key]
+
+    @classmethod
+    def stop_all(cls):
+        with cls._lock:
+            collectors = list(cls._instances.values())
+            cls._instances.clear()
+        # timestats is device wide, disable it once per device
+        for device in {collector.device for collector in collectors}:
+            adb.shell(cmd='dumpsys SurfaceFlinger --timestats -disable; dumpsys SurfaceFlinger --timestats -clear',
+                      deviceId=device)
+
+    @staticmethod
+    def supported(device):
+        try:
+            return int(adb.shell(cmd='getprop ro.build.version.sdk', deviceId=device)) >= 29
+        except ValueError:
+            return False
+
+    def __init__(self, device, package_name):
+        self.device = device
+        self.package_name = package_name
+        self.layer = None
+
+    def start(self):
+        adb.shell(cmd='dumpsys SurfaceFlinger --timestats -clear; dumpsys SurfaceFlinger --timestats -enable',
+                  deviceId=self.device)
+
+    def pick_layer(self, layers):
+        """the layer of the package with the most frames, surfaceview and activity layers alike"""
+        layers = [layer for layer in layers if layer.get('packageName') == self.package_name
+                  or self.package_name in layer.get('layerName', '')]
+        if not layers:
+            return None
+        layer = max(layers, key=lambda item: item.get('totalFrames', 0) if isinstance(item.get('totalFrames'), int)
+                    else 0)
+        if layer['layerName'] != self.layer:
+            self.layer = layer['layerName']
+            logger.info('timestats layer: {}'.format(self.layer))
+        return layer
+
+    def stats(self):
+        """
+        FPS and jank of the frames presented since the previous call
+        :return: fps, jank, bigjank, jank_time, dropped frames
+        """
+        output = adb.shell(cmd='dumpsys SurfaceFlinger --timestats -dump; dumpsys SurfaceFlinger --timestats -clear',
+                           deviceId=self.device)
+        layer = self.pick_layer(frame_analysis.parse_timestats(output))
+        if layer is None:
+            return 0, 0, 0, 0, 0
+        fps, jank, bigjank, jank_time = frame_analysis.histogram_stats(layer.get('present2present'))
+        dropped = layer.get('droppedFrames', 0)
+        return fps, jank, bigjank, jank_time, dropped if isinstance(dropped, int) else 0
+
+
 class TimeUtils(object):
     UnderLineFormatter = "%Y_%m_%d_%H_%M_%S"
     NormalFormatter = "%Y-%m-%d %H-%M-%S"
@@ -573,7 +884,7 @@ class TimeUtils(object):
 
 class FPSMonitor(Monitor):
     def __init__(self, device_id, package_name=None, frequency=1.0, timeout=24 * 60 * 60, fps_queue=None,
-                 jank_threshold=166, use_legacy=False, surfaceview=True, start_time=None, **kwargs):
+                 jank_threshold=166, use_legacy=False, surfaceview=True, start_time=None, window=None, **kwargs):
         super().__init__(**kwargs)
         self.start_time = start_time
         self.use_legacy = use_legacy
@@ -583,40 +894,27 @@ class FPSMonitor(Monitor):
         self.timeout = timeout
         self.surfaceview = surfaceview
         self.package = package_name
+        self.session = FPSSession.get(device_id, package_name, window)
         self.fpscollector = SurfaceStatsCollector(self.device, self.frequency, package_name, fps_queue,
-                                                  self.jank_threshold, self.surfaceview, self.use_legacy)
+                                                  self.jank_threshold, self.surfaceview, self.use_legacy,
+                                                  session=self.session)
 
     def start(self):
         self.fpscollector.start(self.start_time)
 
     def stop(self):
-        global collect_fps
-        global collect_jank
-        global collect_bigjank
-        global collect_jank_time
-        global collect_Stutter
         self.fpscollector.stop()
-        return collect_fps, collect_jank, collect_bigjank, collect_jank_time, collect_Stutter
+        return self.session.result()
 
     def save(self):
         pass
 
     @classmethod
     def clear_up_first_time(cls):
-        global first_collect_time
-        global this_jank_time
-        global collect_Stutter
-        global collect_fps
-        global collect_jank
-        global collect_bigjank
-        global collect_jank_time
-        first_collect_time = 0
-        this_jank_time = 0
-        collect_Stutter = 0
-        collect_fps = 0
-        collect_jank = 0
-        collect_bigjank = 0
-        collect_jank_time = 0
+        FrameStreamCollector.stop_all()
+        TimeStatsCollector.stop_all()
+        FPSSession.clear_all()
+        LayerResolver.clear_all()
         logger.debug("归0fps所有参数")
 
     def parse(self, file_path):
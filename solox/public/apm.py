@@ -2,15 +2,18 @@ import datetime
 import re
 import time
 import os
-import json
 from logzero import logger
 import tidevice
-import multiprocessing
+import threading
 import solox.public._iosPerf as iosP
 from solox.public.iosperf._perf import DataType, Performance
 from solox.public.adb import adb
-from solox.public.common import Devices, File, Method, Platform, Scrcpy
-from solox.public.android_fps import FPSMonitor, TimeUtils
+from solox.public.common import Devices, File, Method, PidCache, Platform, Scrcpy
+from solox.public import frame_analysis
+from solox.public.android_fps import FPSMonitor, FPSSession, FrameStreamCollector, TimeStatsCollector
+from solox.public.probe import DeviceProbes
+from solox.public.scheduler import AdaptivePolicy, SamplingScheduler
+from solox.public.control import RunControl
 
 d = Devices()
 f = File()
@@ -19,6 +22,7 @@ m = Method()
 
 class Target:
     CPU = 'cpu'
+    CPUThread = 'cpu_thread'
     CPUFreq = 'cpufreq'
     Memory = 'memory'
     MemoryDetail = 'memory_detail'
@@ -26,15 +30,20 @@ class Target:
     Network = 'network'
     FPS = 'fps'
     GPU = 'gpu'
+    Thermal = 'thermal'
 
 
 class Singleton(type):
     _instances = {}
+    _lock = threading.RLock()
 
     def __call__(cls, *args, **kwargs):
         key = (cls, args, tuple(sorted(kwargs.items())))
         if key not in cls._instances:
-            cls._instances[key] = super().__call__(*args, **kwargs)
+            # samplers share one process, two threads must not build the same instance twice
+            with cls._lock:
+                if key not in cls._instances:
+                    cls._instances[key] = super().__call__(*args, **kwargs)
         return cls._instances[key]
 
     @classmethod
@@ -43,14 +52,73 @@ class Singleton(type):
 
 
 class CPU(metaclass=Singleton):
-
-    def __init__(self, pkgName, deviceId, platform=Platform.Android, pid=None):
+    # previous jiffies snapshot and last rates per (deviceId, pid), or per (deviceId, pkgName) for packages
+    cpuSnapshots = {}
+    cpuRates = {}
+    threadSnapshots = {}
+    threadRates = {}
+    packageSnapshots = {}
+    packageRates = {}
+    # (deviceId, pkgName): pids with a stat probe registered
+    packageProbes = {}
+    # per deviceId
+    coreSnapshots = {}
+    coreStats = {}
+    # seconds between the baseline and the first reading of a new process
+    BASELINE = 0.5
+
+    def __init__(self, pkgName, deviceId, platform=Platform.Android, pid=None, aggregate=False):
         self.pkgName = pkgName
         self.deviceId = deviceId
         self.platform = platform
         self.pid = pid
+        self.aggregate = aggregate
         if self.pid is None and self.platform == Platform.Android:
-            self.pid = d.getPid(pkgName=self.pkgName, deviceId=self.deviceId)[0].split(':')[0]
+            self.pid = str(list(PidCache.get(self.deviceId, self.pkgName).processes())[0])
+        if self.platform == Platform.Android:
+            self.probes = DeviceProbes.get(self.deviceId)
+            self.probes.register('stat', 'cat /proc/stat')
+            self.probes.register(f'pid/{self.pid}/stat', f'cat /proc/{self.pid}/stat')
+
+    @classmethod
+    def clear(cls):
+        cls.cpuSnapshots.clear()
+        cls.cpuRates.clear()
+        cls.threadSnapshots.clear()
+        cls.threadRates.clear()
+        cls.packageSnapshots.clear()
+        cls.packageProbes.clear()
+        cls.packageRates.clear()
+        cls.coreSnapshots.clear()
+        cls.coreStats.clear()
+
+    @staticmethod
+    def parseCpuStat(result):
+        """parse /proc/stat into (total jiffies, idle jiffies, user/nice/system/idle of the cpu line)"""
+        totalCpu, idleCpu, cpuTime = 0, 0, None
+        for line in result.split('\n'):
+            toks = line.split()
+            if not toks or not toks[0].startswith('cpu'):
+                continue
+            totalCpu += sum(int(tok) for tok in toks[1:8])
+            idleCpu += int(toks[4])
+            if toks[0] == 'cpu':
+                cpuTime = [int(tok) for tok in toks[1:5]]
+        return totalCpu, idleCpu, cpuTime
+
+    @staticmethod
+    def parseProcessStat(result):
+        """parse /proc/<pid>/stat into utime + stime + cutime + cstime"""
+        # comm may contain spaces, fields are counted from the closing parenthesis
+        toks = result[result.rindex(')') + 1:].split()
+        return int(toks[11]) + int(toks[12]) + int(toks[13]) + int(toks[14])
+
+    def getCpuSnapshot(self, max_age=None):
+        """read /proc/stat and /proc/<pid>/stat in the same batched tick"""
+        snapshot = self.probes.snapshot(max_age, names=['stat', f'pid/{self.pid}/stat'])
+        totalCpu, idleCpu, cpuTime = self.parseCpuStat(snapshot.get('stat'))
+        processCpu = self.parseProcessStat(snapshot.get(f'pid/{self.pid}/stat'))
+        return processCpu, totalCpu, idleCpu, cpuTime
 
     def getprocessCpuStat(self):
         """get the cpu usage of a process at a certain time"""
@@ -63,7 +131,7 @@ class CPU(metaclass=Singleton):
 
     def getTotalCpuStat(self):
         """get the total cpu usage at a certain time"""
-        cmd = 'cat /proc/stat |{} ^cpu'.format(d.filterType())
+        cmd = 'cat /proc/stat | grep ^cpu'
         result = adb.shell(cmd=cmd, deviceId=self.deviceId)
         totalCpu = 0
         lines = result.split('\n')
@@ -87,7 +155,7 @@ class CPU(metaclass=Singleton):
 
     def getSysCpuStat(self):
         """get the total cpu usage at a certain time"""
-        cmd = 'cat /proc/stat |{} ^cpu'.format(d.filterType())
+        cmd = 'cat /proc/stat | grep ^cpu'
         result = adb.shell(cmd=cmd, deviceId=self.deviceId)
         r = re.compile(r'(?<!cpu\d)')
         toks = r.findall(result)
@@ -98,7 +166,7 @@ class CPU(metaclass=Singleton):
 
     def getIdleCpuStat(self):
         """get the total cpu usage at a certain time"""
-        cmd = 'cat /proc/stat |{} ^cpu'.format(d.filterType())
+        cmd = 'cat /proc/stat | grep ^cpu'
         result = adb.shell(cmd=cmd, deviceId=self.deviceId)
         ileCpu = 0
         lines = result.split('\n')
@@ -110,7 +178,7 @@ class CPU(metaclass=Singleton):
         return ileCpu
 
     def get_process_cpu_time(self, this_pid):
-        cmd = 'cat /proc/{}/stat'.format(this_pid, d.filterType())
+        cmd = 'cat /proc/{}/stat'.format(this_pid)
         result = adb.shell(cmd=cmd, deviceId=self.deviceId)
         process_stat = result.split(' ')
         utime = int(process_stat[13])
@@ -120,7 +188,7 @@ class CPU(metaclass=Singleton):
         return utime + stime + cutime + cstime
 
     def get_cpu_time(self):
-        cmd = 'cat /proc/stat |{} ^cpu'.format(d.filterType())
+        cmd = 'cat /proc/stat | grep ^cpu'
         result = adb.shell(cmd=cmd, deviceId=self.deviceId)
         # print(result)
         for line in result.split('\n'):
@@ -129,75 +197,232 @@ class CPU(metaclass=Singleton):
                 return [int(hh_cpu_time) for hh_cpu_time in cpu_time]
 
     def get_cpu_corenum(self):
-        cmd = 'cat /proc/cpuinfo |{} processor'.format(d.filterType())
+        cmd = 'cat /proc/cpuinfo | grep processor'
         result = adb.shell(cmd=cmd, deviceId=self.deviceId)
         return len(result.split('\n'))
 
+    @staticmethod
+    def parseCoreStat(result):
+        """parse the cpuN lines of /proc/stat into {core: (total jiffies, idle jiffies)}"""
+        cores = {}
+        for line in result.split('\n'):
+            toks = line.split()
+            if toks and toks[0].startswith('cpu') and toks[0][3:].isdigit():
+                cores[int(toks[0][3:])] = (sum(int(tok) for tok in toks[1:8]), int(toks[4]))
+        return cores
+
+    @staticmethod
+    def parseCoreValues(result):
+        """parse '#<core>' delimited sysfs reads into {core: [lines]}"""
+        cores, core = {}, None
+        for line in result.split('\n'):
+            line = line.strip()
+            if line.startswith('#') and line[1:].isdigit():
+                core = int(line[1:])
+                cores[core] = []
+            elif line and core is not None:
+                cores[core].append(line)
+        return cores
+
+    def readCoreProbes(self, max_age=None):
+        """read per-core /proc/stat, scaling_cur_freq and time_in_state in the same batched tick"""
+        cores = 'for c in /sys/devices/system/cpu/cpu[0-9]*; do echo "#${c##*cpu}"; cat $c/cpufreq/%s; done'
+        self.probes.register('cpufreq', cores % 'scaling_cur_freq')
+        self.probes.register('cpufreq/time_in_state', cores % 'stats/time_in_state')
+        snapshot = self.probes.snapshot(max_age, names=['stat', 'cpufreq', 'cpufreq/time_in_state'])
+        coreStat = self.parseCoreStat(snapshot.get('stat'))
+        coreFreq = {core: int(lines[0]) for core, lines in self.parseCoreValues(snapshot.get('cpufreq')).items()
+                    if lines and lines[0].isdigit()}
+        timeInState = {}
+        for core, lines in self.parseCoreValues(snapshot.get('cpufreq/time_in_state')).items():
+            timeInState[core] = {int(line.split()[0]): int(line.split()[1]) for line in lines if len(line.split()) == 2}
+        return coreStat, coreFreq, timeInState
+
     def get_cpu_freq(self):
+        """get the current frequency of every core ordered by core index, offline cores read 0"""
         try:
-            # 获取每个CPU核心的使用率
-            # cmd = f'adb -s {device} shell "top -n 1 | grep -E \'Cpu[0-9]\'"'
-            cmd = 'cat /sys/devices/system/cpu/cpu*/cpufreq/scaling_cur_freq'
-            res = adb.shell(cmd=cmd, deviceId=self.deviceId)
-            time.sleep(1)  # 添加延迟以确保命令的输出已经被完全填充
-            res = res.split('\n')
-            cpu_usage = []
-            for line in res:
-                cpu_usage.append(int(line))
-            sorted_list = sorted(cpu_usage, reverse=True)
-            # print(sorted_list)
-            return sorted_list
+            coreFreq = self.readCoreProbes()[1]
+            if not coreFreq:
+                return None
+            return [coreFreq.get(core, 0) for core in range(max(coreFreq) + 1)]
         except Exception:
             return None
 
+    def getAndroidCoreStat(self, noLog=False):
+        """get utilization, frequency and frequency residency of every core since the previous reading"""
+        key = self.deviceId
+        try:
+            current = self.readCoreProbes()
+            previous = self.coreSnapshots.get(key)
+            if previous is None or sum(total for total, _ in current[0].values()) <= \
+                    sum(total for total, _ in previous[0].values()):
+                self.coreSnapshots.setdefault(key, current)
+                return self.coreStats.get(key, [])
+            self.coreSnapshots[key] = current
+            coreStat, coreFreq, timeInState = current
+            cores = []
+            for core in sorted(set(coreStat) | set(coreFreq)):
+                usage = 0
+                if core in coreStat and core in previous[0]:
+                    total = coreStat[core][0] - previous[0][core][0]
+                    idle = coreStat[core][1] - previous[0][core][1]
+                    usage = round((total - idle) / total * 100, 2) if total > 0 else 0
+                residency = {}
+                before = previous[2].get(core, {})
+                spent = {freq: value - before.get(freq, value) for freq, value in timeInState.get(core, {}).items()}
+                if sum(spent.values()) > 0:
+                    residency = {freq: round(value / sum(spent.values()) * 100, 2) for freq, value in spent.items()}
+                cores.append({'core': core, 'usage': usage, 'freq': coreFreq.get(core, 0), 'residency': residency})
+            self.coreStats[key] = cores
+            if noLog is False:
+                apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
+                for item in cores:
+                    f.add_log(os.path.join(f.report_dir, 'cpu_core_{}.log'.format(item['core'])), apm_time, item['usage'])
+                    f.add_log(os.path.join(f.report_dir, 'cpu_freq_{}.log'.format(item['core'])), apm_time, item['freq'])
+                f.add_record(os.path.join(f.report_dir, 'cpu_residency.log'), apm_time,
+                             {item['core']: item['residency'] for item in cores})
+        except Exception as e:
+            cores = []
+            self.coreSnapshots.pop(key, None)
+            logger.exception(e)
+        return cores
+
     def getAndroidCpuRate(self, noLog=False):
-        """get the Android cpu rate of a process"""
+        """get the Android cpu rate of a process from the jiffies elapsed since the previous reading"""
+        key = (self.deviceId, self.pid)
         try:
-            # processCpuTime_1 = self.getprocessCpuStat()
-            process_cpu_time1 = self.get_process_cpu_time(self.pid)
-            totalCpuTime_1 = self.getTotalCpuStat()
-            idleCputime_1 = self.getIdleCpuStat()
-            cpu_time1 = self.get_cpu_time()
-
-            time.sleep(0.5)
-
-            # processCpuTime_2 = self.getprocessCpuStat()
-            process_cpu_time2 = self.get_process_cpu_time(self.pid)
-            totalCpuTime_2 = self.getTotalCpuStat()
-            idleCputime_2 = self.getIdleCpuStat()
-            cpu_time2 = self.get_cpu_time()
-            # appCpuRate = round(float((processCpuTime_2 - processCpuTime_1) / (totalCpuTime_2 - totalCpuTime_1) *
-            # 100), 2)
+            current = self.getCpuSnapshot()
+            previous = self.cpuSnapshots.get(key)
+            if previous is None:
+                # first reading of this process: keep it as the baseline and measure over a short window
+                self.cpuSnapshots[key] = current
+                time.sleep(self.BASELINE)
+                return self.getAndroidCpuRate(noLog=noLog)
+            if current[1] <= previous[1]:
+                # still the same tick: nothing new to compare
+                return self.cpuRates.get(key, (0, 0))
+            self.cpuSnapshots[key] = current
+            process_cpu_time1, totalCpuTime_1, idleCputime_1, cpu_time1 = previous
+            process_cpu_time2, totalCpuTime_2, idleCputime_2, cpu_time2 = current
             total_process_cpu_time = process_cpu_time2 - process_cpu_time1
             total_cpu_time = sum([cpu_time2[i] - cpu_time1[i] for i in range(4)])
             appCpuRate = round(float(total_process_cpu_time / total_cpu_time) * 100, 2)
 
             sysCpuRate = round(float(((totalCpuTime_2 - idleCputime_2) - (totalCpuTime_1 - idleCputime_1)) / (
                         totalCpuTime_2 - totalCpuTime_1) * 100), 2)
+            self.cpuRates[key] = appCpuRate, sysCpuRate
             if noLog is False:
                 apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
                 f.add_log(os.path.join(f.report_dir, 'cpu_app.log'), apm_time, appCpuRate)
                 f.add_log(os.path.join(f.report_dir, 'cpu_sys.log'), apm_time, sysCpuRate)
         except Exception as e:
             appCpuRate, sysCpuRate = 0, 0
+            self.cpuSnapshots.pop(key, None)
             if len(d.getPid(self.deviceId, self.pkgName)) == 0:
                 logger.error('[CPU] {} : No process found'.format(self.pkgName))
             else:
                 logger.exception(e)
         return appCpuRate, sysCpuRate
 
-    def getAndroidCpuFreq(self, noLog=False):
+    @staticmethod
+    def parseThreadStat(result):
+        """parse the concatenated /proc/<pid>/task/*/stat into {tid: (name, utime + stime)}"""
+        threads = {}
+        for line in result.split('\n'):
+            if ')' not in line:
+                continue
+            head, _, tail = line.rpartition(')')
+            tid, _, name = head.partition(' (')
+            toks = tail.split()
+            threads[int(tid)] = (name, int(toks[11]) + int(toks[12]))
+        return threads
+
+    def getAndroidThreadCpu(self, top=5, noLog=False):
+        """get the cpu rate of the busiest threads of a process since the previous reading"""
+        key = (self.deviceId, self.pid)
+        probe = f'pid/{self.pid}/task'
         try:
-            cpufreq = self.get_cpu_freq()
-            # print("getAndroidCpuFreq", cpufreq)
+            self.probes.register(probe, f'cat /proc/{self.pid}/task/*/stat')
+            snapshot = self.probes.snapshot(names=['stat', probe])
+            threads = self.parseThreadStat(snapshot.get(probe))
+            cpuTime = sum(self.parseCpuStat(snapshot.get('stat'))[2])
+            previous = self.threadSnapshots.get(key)
+            if previous is None or cpuTime <= previous[1]:
+                self.threadSnapshots.setdefault(key, (threads, cpuTime))
+                return self.threadRates.get(key, [])
+            self.threadSnapshots[key] = (threads, cpuTime)
+            total_cpu_time = cpuTime - previous[1]
+            rates = []
+            for tid, (name, jiffies) in threads.items():
+                delta = jiffies - previous[0].get(tid, (name, jiffies))[1]
+                if delta > 0:
+                    rates.append({'tid': tid, 'name': name, 'cpu': round(delta / total_cpu_time * 100, 2)})
+            rates = sorted(rates, key=lambda item: item['cpu'], reverse=True)[:top]
+            self.threadRates[key] = rates
             if noLog is False:
                 apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
-                # print("getAndroidCpuFreqLog", cpufreq)
-                for index, cpu in enumerate(cpufreq):
-                    f.add_log(os.path.join(f.report_dir, 'cpu_freq_{}.log'.format(index)), apm_time, cpu)
-                # f.add_log(os.path.join(f.report_dir, 'cpu_freq.log'), apm_time, cpufreq)
-        except:
-            pass
+                f.add_record(os.path.join(f.report_dir, 'cpu_thread.log'), apm_time, rates)
+        except Exception as e:
+            rates = []
+            self.threadSnapshots.pop(key, None)
+            logger.exception(e)
+        return rates
+
+    def getPackageCpuRate(self, noLog=False):
+        """get the cpu rate summed over every process of the package, with the per-process split"""
+        key = (self.deviceId, self.pkgName)
+        try:
+            processes = PidCache.get(self.deviceId, self.pkgName).processes()
+            # one stable probe per pid, a process coming or going leaves the other probes of the batch alone
+            for pid in self.packageProbes.get(key, set()) - set(processes):
+                self.probes.unregister(f'pid/{pid}/stat')
+            for pid in processes:
+                self.probes.register(f'pid/{pid}/stat', f'cat /proc/{pid}/stat')
+            self.packageProbes[key] = set(processes)
+            snapshot = self.probes.snapshot(names=['stat'] + [f'pid/{pid}/stat' for pid in processes])
+            totalCpu, idleCpu, cpuTime = self.parseCpuStat(snapshot.get('stat'))
+            cpuTime = sum(cpuTime)
+            jiffies = {}
+            for pid in processes:
+                line = snapshot.get(f'pid/{pid}/stat')
+                if ')' in line:
+                    jiffies[pid] = self.parseProcessStat(line)
+            previous = self.packageSnapshots.get(key)
+            if previous is None:
+                self.packageSnapshots[key] = (jiffies, cpuTime, totalCpu, idleCpu)
+                time.sleep(self.BASELINE)
+                return self.getPackageCpuRate(noLog=noLog)
+            if cpuTime <= previous[1]:
+                return self.packageRates.get(key, (0, 0, {}))
+            self.packageSnapshots[key] = (jiffies, cpuTime, totalCpu, idleCpu)
+            total_cpu_time = cpuTime - previous[1]
+            processCpuRate = {}
+            for pid, value in jiffies.items():
+                # processes born since the previous reading start counting from the next one
+                if pid in previous[0] and pid in processes:
+                    processCpuRate[processes[pid]] = round((value - previous[0][pid]) / total_cpu_time * 100, 2)
+            appCpuRate = round(sum(processCpuRate.values()), 2)
+            sysCpuRate = round(float(((totalCpu - idleCpu) - (previous[2] - previous[3])) / (
+                        totalCpu - previous[2]) * 100), 2)
+            self.packageRates[key] = appCpuRate, sysCpuRate, processCpuRate
+            if noLog is False:
+                apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
+                f.add_log(os.path.join(f.report_dir, 'cpu_app.log'), apm_time, appCpuRate)
+                f.add_log(os.path.join(f.report_dir, 'cpu_sys.log'), apm_time, sysCpuRate)
+                f.add_record(os.path.join(f.report_dir, 'cpu_process.log'), apm_time, processCpuRate)
+        except Exception as e:
+            appCpuRate, sysCpuRate, processCpuRate = 0, 0, {}
+            self.packageSnapshots.pop(key, None)
+            if len(d.getPid(self.deviceId, self.pkgName)) == 0:
+                logger.error('[CPU] {} : No process found'.format(self.pkgName))
+            else:
+                logger.exception(e)
+        return appCpuRate, sysCpuRate, processCpuRate
+
+    def getAndroidCpuFreq(self, noLog=False):
+        """get the current frequency of every core ordered by core index, logged with the per-core stats"""
+        cores = self.getAndroidCoreStat(noLog)
+        cpufreq = [item['freq'] for item in cores] if cores else self.get_cpu_freq()
         return cpufreq
 
     def getiOSCpuRate(self, noLog=False):
@@ -213,8 +438,11 @@ class CPU(metaclass=Singleton):
 
     def getCpuRate(self, noLog=False):
         """Get the cpu rate of a process, unit:%"""
-        appCpuRate, systemCpuRate = self.getAndroidCpuRate(
-            noLog) if self.platform == Platform.Android else self.getiOSCpuRate(noLog)
+        if self.platform == Platform.Android and self.aggregate:
+            appCpuRate, systemCpuRate = self.getPackageCpuRate(noLog)[:2]
+        else:
+            appCpuRate, systemCpuRate = self.getAndroidCpuRate(
+                noLog) if self.platform == Platform.Android else self.getiOSCpuRate(noLog)
         return appCpuRate, systemCpuRate
 
     def getCpuFreq(self, noLog=False):
@@ -222,89 +450,175 @@ class CPU(metaclass=Singleton):
         return CpuFreq
 
 
+# every field Memory reads out of dumpsys meminfo, matched in a single pass
+MEMINFO_FIELDS = re.compile(r'(Java Heap|Native Heap|Code|Stack|Graphics|Private Other|System|'
+                            r'TOTAL PSS|TOTAL SWAP PSS|TOTAL SWAP \(KB\)):\s*(\d+)|(TOTAL)\s+(\d+)')
+MEMINFO_DETAIL = dict(java_heap='Java Heap', native_heap='Native Heap', code_pss='Code', stack_pss='Stack',
+                      graphics_pss='Graphics', private_pss='Private Other', system_pss='System')
+
+
 class Memory(metaclass=Singleton):
-    def __init__(self, pkgName, deviceId, platform=Platform.Android, pid=None):
+    # default seconds between two dumpsys meminfo reads
+    MEMINFO_INTERVAL = 5.0
+    # (deviceId, pid): (monotonic, {field: kB}) of the latest dumpsys meminfo
+    meminfoSnapshots = {}
+    # (deviceId, pkgName): (monotonic, {process name: {'total', 'swap'}}) of the latest read of every process
+    packageMeminfo = {}
+
+    def __init__(self, pkgName, deviceId, platform=Platform.Android, pid=None, aggregate=False,
+                 meminfoInterval=MEMINFO_INTERVAL):
+        """
+        :param meminfoInterval: seconds a dumpsys meminfo read is reused, smaps_rollup is read every sample
+        """
         self.pkgName = pkgName
         self.deviceId = deviceId
         self.platform = platform
         self.pid = pid
+        self.aggregate = aggregate
+        self.meminfoInterval = meminfoInterval
         if self.pid is None and self.platform == Platform.Android:
-            self.pid = d.getPid(pkgName=self.pkgName, deviceId=self.deviceId)[0].split(':')[0]
+            self.pid = str(list(PidCache.get(self.deviceId, self.pkgName).processes())[0])
+        if self.platform == Platform.Android:
+            self.probes = DeviceProbes.get(self.deviceId)
+            self.probe = f'pid/{self.pid}/smaps_rollup'
+            self.probes.register(self.probe, f'cat /proc/{self.pid}/smaps_rollup 2>/dev/null')
+
+    @classmethod
+    def clear(cls):
+        cls.meminfoSnapshots.clear()
+        cls.packageMeminfo.clear()
+
+    @staticmethod
+    def parseMemInfoFields(output):
+        """parse dumpsys meminfo once into {field: kB}, the first occurrence of a field wins"""
+        fields = {}
+        for match in MEMINFO_FIELDS.finditer(output):
+            label, value = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+            fields.setdefault(label, int(value))
+        return fields
+
+    @staticmethod
+    def parseMemInfo(output):
+        """parse the total and swap pss out of dumpsys meminfo, unit:MB"""
+        fields = output if isinstance(output, dict) else Memory.parseMemInfoFields(output)
+        total = fields.get('TOTAL', fields.get('TOTAL PSS'))
+        swap = fields.get('TOTAL SWAP PSS', fields.get('TOTAL SWAP (KB)'))
+        totalPass = round(float(total) / 1024, 2)
+        swapPass = round(float(swap) / 1024, 2)
+        return totalPass, swapPass
+
+    @staticmethod
+    def parseMemInfoDetail(output):
+        """parse the seven app summary categories out of dumpsys meminfo, unit:MB"""
+        fields = output if isinstance(output, dict) else Memory.parseMemInfoFields(output)
+        return {name: round(float(fields[label]) / 1024, 2) for name, label in MEMINFO_DETAIL.items()}
+
+    @staticmethod
+    def parseProcMemory(output):
+        """parse smaps_rollup into {'pss', 'swap_pss', 'rss'}, unit:kB, missing fields are left out"""
+        values = {}
+        for line in output.split('\n'):
+            toks = line.split()
+            if len(toks) >= 2 and toks[0] in ('Pss:', 'SwapPss:', 'Rss:') and toks[1].isdigit():
+                values[{'Pss:': 'pss', 'SwapPss:': 'swap_pss', 'Rss:': 'rss'}[toks[0]]] = int(toks[1])
+        return values
+
+    def getMemInfo(self, force=False):
+        """run and parse dumpsys meminfo at most once per meminfoInterval, returns {field: kB}"""
+        key = (self.deviceId, self.pid)
+        cached = self.meminfoSnapshots.get(key)
+        if force or cached is None or time.monotonic() - cached[0] >= self.meminfoInterval:
+            output = adb.shell(cmd='dumpsys meminfo {}'.format(self.pid), deviceId=self.deviceId)
+            cached = (time.monotonic(), self.parseMemInfoFields(output))
+            self.meminfoSnapshots[key] = cached
+        return cached[1]
 
     def getAndroidMemory(self):
         """Get the Android memory ,unit:MB"""
         try:
-            cmd = 'dumpsys meminfo {}'.format(self.pid)
-            output = adb.shell(cmd=cmd, deviceId=self.deviceId)
-            m_total = re.search(r'TOTAL\s*(\d+)', output)
-            if not m_total:
-                m_total = re.search(r'TOTAL PSS:\s*(\d+)', output)
-            m_swap = re.search(r'TOTAL SWAP PSS:\s*(\d+)', output)
-            if not m_swap:
-                m_swap = re.search(r'TOTAL SWAP \(KB\):\s*(\d+)', output)
-            totalPass = round(float(float(m_total.group(1))) / 1024, 2)
-            swapPass = round(float(float(m_swap.group(1))) / 1024, 2)
+            values = self.parseProcMemory(self.probes.snapshot(names=[self.probe]).get(self.probe))
+            if 'pss' in values:
+                # smaps Pss only covers the process mappings, unlike dumpsys TOTAL PSS it leaves out graphics
+                totalPass = round(values['pss'] / 1024, 2)
+                swapPass = round(values.get('swap_pss', 0) / 1024, 2)
+            else:
+                # smaps_rollup is not readable for this process, hold the last dumpsys TOTAL PSS between refreshes
+                totalPass, swapPass = self.parseMemInfo(self.getMemInfo())
         except Exception as e:
             totalPass, swapPass = 0, 0
+            self.meminfoSnapshots.pop((self.deviceId, self.pid), None)
             if len(d.getPid(self.deviceId, self.pkgName)) == 0:
                 logger.error('[Memory] {} : No process found'.format(self.pkgName))
             else:
                 logger.exception(e)
         return totalPass, swapPass
 
+    def getPackageMemory(self, noLog=False):
+        """Get the memory summed over every process of the package, with the per-process split, unit:MB"""
+        processMemory = {}
+        key = (self.deviceId, self.pkgName)
+        try:
+            cached = self.packageMeminfo.get(key)
+            if cached is None or time.monotonic() - cached[0] >= self.meminfoInterval:
+                # one dumpsys per process on its own call, a slow one cannot hold the others past their timeout
+                for pid, name in PidCache.get(self.deviceId, self.pkgName).processes().items():
+                    output = adb.shell(cmd='dumpsys meminfo {}'.format(pid), deviceId=self.deviceId)
+                    # a process may have died between the pid refresh and the read
+                    if output and re.search(r'TOTAL', output):
+                        totalPass, swapPass = self.parseMemInfo(output)
+                        processMemory[name] = {'total': totalPass, 'swap': swapPass}
+                self.packageMeminfo[key] = (time.monotonic(), processMemory)
+            else:
+                processMemory = cached[1]
+            totalPass = round(sum(item['total'] for item in processMemory.values()), 2)
+            swapPass = round(sum(item['swap'] for item in processMemory.values()), 2)
+            if noLog is False:
+                apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
+                f.add_record(os.path.join(f.report_dir, 'mem_process.log'), apm_time, processMemory)
+        except Exception as e:
+            totalPass, swapPass = 0, 0
+            self.packageMeminfo.pop(key, None)
+            if len(d.getPid(self.deviceId, self.pkgName)) == 0:
+                logger.error('[Memory] {} : No process found'.format(self.pkgName))
+            else:
+                logger.exception(e)
+        return totalPass, swapPass, processMemory
+
     def getAndroidMemoryDetail(self, noLog=False):
         """Get the Android detail memory ,unit:MB"""
         try:
-            cmd = 'dumpsys meminfo {}'.format(self.pid)
-            output = adb.shell(cmd=cmd, deviceId=self.deviceId)
-            m_java = re.search(r'Java Heap:\s*(\d+)', output)
-            m_native = re.search(r'Native Heap:\s*(\d+)', output)
-            m_code = re.search(r'Code:\s*(\d+)', output)
-            m_stack = re.search(r'Stack:\s*(\d+)', output)
-            m_graphics = re.search(r'Graphics:\s*(\d+)', output)
-            m_private = re.search(r'Private Other:\s*(\d+)', output)
-            m_system = re.search(r'System:\s*(\d+)', output)
-            java_heap = round(float(float(m_java.group(1))) / 1024, 2)
-            native_heap = round(float(float(m_native.group(1))) / 1024, 2)
-            code_pss = round(float(float(m_code.group(1))) / 1024, 2)
-            stack_pss = round(float(float(m_stack.group(1))) / 1024, 2)
-            graphics_pss = round(float(float(m_graphics.group(1))) / 1024, 2)
-            private_pss = round(float(float(m_private.group(1))) / 1024, 2)
-            system_pss = round(float(float(m_system.group(1))) / 1024, 2)
-            memory_dict = dict(
-                java_heap=java_heap,
-                native_heap=native_heap,
-                code_pss=code_pss,
-                stack_pss=stack_pss,
-                graphics_pss=graphics_pss,
-                private_pss=private_pss,
-                system_pss=system_pss
-            )
+            memory_dict = self.parseMemInfoDetail(self.getMemInfo())
             if noLog is False:
                 apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
-                f.add_log(os.path.join(f.report_dir, 'mem_java_heap.log'), apm_time, memory_dict.get('java_heap'))
-                f.add_log(os.path.join(f.report_dir, 'mem_native_heap.log'), apm_time, memory_dict.get('native_heap'))
-                f.add_log(os.path.join(f.report_dir, 'mem_code_pss.log'), apm_time, memory_dict.get('code_pss'))
-                f.add_log(os.path.join(f.report_dir, 'mem_stack_pss.log'), apm_time, memory_dict.get('stack_pss'))
-                f.add_log(os.path.join(f.report_dir, 'mem_graphics_pss.log'), apm_time, memory_dict.get('graphics_pss'))
-                f.add_log(os.path.join(f.report_dir, 'mem_private_pss.log'), apm_time, memory_dict.get('private_pss'))
-                f.add_log(os.path.join(f.report_dir, 'mem_system_pss.log'), apm_time, memory_dict.get('system_pss'))
+                self.logMemoryDetail(apm_time, memory_dict)
         except Exception as e:
-            memory_dict = dict(
-                java_heap=0,
-                native_heap=0,
-                code_pss=0,
-                stack_pss=0,
-                graphics_pss=0,
-                private_pss=0,
-                system_pss=0
-            )
+            memory_dict = {name: 0 for name in MEMINFO_DETAIL}
             if len(d.getPid(self.deviceId, self.pkgName)) == 0:
                 logger.error('[Memory Detail] {} : No process found'.format(self.pkgName))
             else:
                 logger.exception(e)
         return memory_dict
 
+    @staticmethod
+    def logMemoryDetail(apm_time, memory_dict):
+        for name in MEMINFO_DETAIL:
+            f.add_log(os.path.join(f.report_dir, 'mem_{}.log'.format(name)), apm_time, memory_dict.get(name))
+
+    def getMemory(self, noLog=False):
+        """
+        Get total, swap and the detail categories out of one meminfo snapshot per tick ,unit:MB
+        :return: total, swap, detail dict (empty on iOS)
+        """
+        totalPass, swapPass = self.getProcessMemory(noLog=True)
+        memory_dict = self.getAndroidMemoryDetail(noLog=True) if self.platform == Platform.Android else {}
+        if noLog is False:
+            apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
+            f.add_log(os.path.join(f.report_dir, 'mem_total.log'), apm_time, totalPass)
+            if self.platform == Platform.Android:
+                f.add_log(os.path.join(f.report_dir, 'mem_swap.log'), apm_time, swapPass)
+                self.logMemoryDetail(apm_time, memory_dict)
+        return totalPass, swapPass, memory_dict
+
     def getiOSMemory(self):
         """Get the iOS memory"""
         apm = iosAPM(self.pkgName, self.deviceId)
@@ -314,7 +628,10 @@ class Memory(metaclass=Singleton):
 
     def getProcessMemory(self, noLog=False):
         """Get the app memory"""
-        totalPass, swapPass = self.getAndroidMemory() if self.platform == Platform.Android else self.getiOSMemory()
+        if self.platform == Platform.Android and self.aggregate:
+            totalPass, swapPass = self.getPackageMemory(noLog)[:2]
+        else:
+            totalPass, swapPass = self.getAndroidMemory() if self.platform == Platform.Android else self.getiOSMemory()
         if noLog is False:
             apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
             f.add_log(os.path.join(f.report_dir, 'mem_total.log'), apm_time, totalPass)
@@ -324,6 +641,16 @@ class Memory(metaclass=Singleton):
 
 
 class Battery(metaclass=Singleton):
+    SYSFS = '/sys/class/power_supply/battery'
+    # deviceIds whose charging state is overridden for the session
+    overrides = set()
+    # deviceId: {'level': %, 'temperature': °C, 'current': mA, 'voltage': mV} of the last Android reading
+    readings = {}
+    # deviceId: energy_value files of the on-device power monitor (ODPM), [] without one
+    odpm = {}
+    # deviceId: {'time': monotonic, 'odpm': uWs or None, 'power': mW, 'energy': mWh}
+    energy = {}
+
     def __init__(self, deviceId, platform=Platform.Android):
         self.deviceId = deviceId
         self.platform = platform
@@ -336,23 +663,102 @@ class Battery(metaclass=Singleton):
             temperature, current, voltage, power = self.getiOSBattery(noLog)
             return temperature, current, voltage, power
 
+    @staticmethod
+    def parseBatterySysfs(output):
+        """parse name=value lines of power_supply into {name: int}, unreadable files are left out"""
+        values = {}
+        for line in output.split('\n'):
+            name, _, value = line.strip().partition('=')
+            if value.lstrip('-').isdigit():
+                values[name] = int(value)
+        return values
+
+    def setNonCharging(self):
+        """Switch the phone battery to non-charging state, once per session"""
+        if self.deviceId not in self.overrides:
+            adb.shell(cmd='dumpsys battery reset; dumpsys battery set status 1', deviceId=self.deviceId)
+            self.overrides.add(self.deviceId)
+
     def getAndroidBattery(self, noLog=False):
-        """Get android battery info, unit:%"""
-        # Switch mobile phone battery to non-charging state
-        self.recoverBattery()
-        cmd = 'dumpsys battery set status 1'
-        adb.shell(cmd=cmd, deviceId=self.deviceId)
-        # Get phone battery info
-        cmd = 'dumpsys battery'
-        output = adb.shell(cmd=cmd, deviceId=self.deviceId)
-        level = int(re.findall(u'level:\s?(\d+)', output)[0])
-        temperature = int(re.findall(u'temperature:\s?(\d+)', output)[0]) / 10
+        """Get android battery info from power_supply in the batched tick, dumpsys battery as a fallback, unit:%"""
+        self.setNonCharging()
+        names = ' '.join(['capacity', 'temp', 'current_now', 'voltage_now'])
+        cmd = f'for n in {names}; do echo $n=$(cat {self.SYSFS}/$n 2>/dev/null); done'
+        values = self.parseBatterySysfs(DeviceProbes.get(self.deviceId).read('battery', cmd))
+        if 'capacity' in values and 'temp' in values:
+            level = values['capacity']
+            temperature = values['temp'] / 10
+            # current_now is in uA on most kernels, a few report mA
+            current = values.get('current_now', 0)
+            current = round(current / 1000, 2) if abs(current) > 20000 else current
+            voltage = round(values.get('voltage_now', 0) / 1000, 2)
+        else:
+            output = adb.shell(cmd='dumpsys battery', deviceId=self.deviceId)
+            last = self.readings.get(self.deviceId, {})
+            level = re.findall(u'level:\s?(\d+)', output)
+            temperature = re.findall(u'temperature:\s?(\d+)', output)
+            if level and temperature:
+                level, temperature = int(level[0]), int(temperature[0]) / 10
+            else:
+                level, temperature = last.get('level', 0), last.get('temperature', 0)
+                logger.warning('[Battery] {} : dumpsys battery unreadable, keep the last reading'.format(self.deviceId))
+            current = 0
+            voltage = int((re.findall(u'voltage:\s?(\d+)', output) or [0])[0])
+        self.readings[self.deviceId] = {'level': level, 'temperature': temperature, 'current': current,
+                                        'voltage': voltage}
+        power, energy = self.getAndroidPower(current, voltage)
         if noLog is False:
             apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
             f.add_log(os.path.join(f.report_dir, 'battery_level.log'), apm_time, level)
             f.add_log(os.path.join(f.report_dir, 'battery_tem.log'), apm_time, temperature)
+            f.add_log(os.path.join(f.report_dir, 'battery_power.log'), apm_time, power)  # mW
+            f.add_log(os.path.join(f.report_dir, 'battery_energy.log'), apm_time, energy)  # mWh
         return level, temperature
 
+    @staticmethod
+    def parseOdpm(output):
+        """sum the rail energies of energy_value files, 'CHn(T=..)[RAIL], <uWs>' lines, unit:uWs"""
+        total = 0
+        for line in output.split('\n'):
+            if line.startswith('CH') and ',' in line:
+                value = line.rsplit(',', 1)[1].strip()
+                if value.isdigit():
+                    total += int(value)
+        return total
+
+    def getAndroidPower(self, current, voltage):
+        """
+        Instantaneous power and the energy used since the session start, from the power rails when the device
+        exposes ODPM, from battery current x voltage otherwise
+        :return: power in mW, cumulative energy in mWh
+        """
+        if self.deviceId not in self.odpm:
+            cmd = 'for p in /sys/bus/iio/devices/iio:device*/energy_value; do cat $p >/dev/null 2>&1 && echo $p; done'
+            self.odpm[self.deviceId] = adb.shell(cmd=cmd, deviceId=self.deviceId).split()
+            logger.info('[Battery] {} power rails: {}'.format(self.deviceId, self.odpm[self.deviceId] or 'none'))
+        now = time.monotonic()
+        odpm = None
+        if self.odpm[self.deviceId]:
+            output = DeviceProbes.get(self.deviceId).read('battery/odpm', 'cat {}'.format(' '.join(self.odpm[self.deviceId])))
+            odpm = self.parseOdpm(output) or None
+        previous = self.energy.get(self.deviceId)
+        if odpm is not None and previous is not None and previous['odpm'] is not None:
+            elapsed = now - previous['time']
+            used = odpm - previous['odpm']
+            # uWs over ms is mW
+            power = round(used / (elapsed * 1000), 2) if elapsed > 0 and used >= 0 else previous['power']
+        else:
+            power = round(abs(current) * voltage / 1000, 2)
+        if previous is None:
+            energy = 0
+        elif odpm is not None and previous['odpm'] is not None and odpm >= previous['odpm']:
+            # 1 mWh = 3.6e6 uWs
+            energy = previous['energy'] + (odpm - previous['odpm']) / 3.6e6
+        else:
+            energy = previous['energy'] + power * (now - previous['time']) / 3600
+        self.energy[self.deviceId] = {'time': now, 'odpm': odpm, 'power': power, 'energy': energy}
+        return power, round(energy, 4)
+
     def getiOSBattery(self, noLog=False):
         """Get ios battery info, unit:%"""
         d = tidevice.Device(udid=self.deviceId)
@@ -373,44 +779,220 @@ class Battery(metaclass=Singleton):
         """Reset phone charging status"""
         cmd = 'dumpsys battery reset'
         adb.shell(cmd=cmd, deviceId=self.deviceId)
+        self.overrides.discard(self.deviceId)
+        self.readings.pop(self.deviceId, None)
+        self.energy.pop(self.deviceId, None)
 
 
 class Network(metaclass=Singleton):
-
-    def __init__(self, pkgName, deviceId, platform=Platform.Android, pid=None):
+    # interface name prefixes tried in order when discovering the active link
+    WIFI_INTERFACES = ('wlan', 'swlan')
+    CELL_INTERFACES = ('rmnet', 'ccmni', 'seth', 'pdp', 'wwan')
+    # deviceId: {'wifi': interface, 'cell': interface}
+    interfaces = {}
+    # key: (monotonic, link, (recv bytes, send bytes)) of the previous reading
+    netSnapshots = {}
+    netRates = {}
+    # (deviceId, pid): (uid, 'qtaguid' | 'netstats' | 'dev')
+    uidBackends = {}
+    # seconds between the baseline and the first reading
+    BASELINE = 0.5
+    # seconds a dumpsys netstats read is reused, the service only refreshes its uid buckets on poll
+    NETSTATS_INTERVAL = 5.0
+    # (deviceId, uid): (monotonic, dumpsys netstats output)
+    netstatsReads = {}
+
+    def __init__(self, pkgName, deviceId, platform=Platform.Android, pid=None, netstatsInterval=NETSTATS_INTERVAL):
         self.pkgName = pkgName
         self.deviceId = deviceId
         self.platform = platform
         self.pid = pid
+        self.netstatsInterval = netstatsInterval
         if self.pid is None and self.platform == Platform.Android:
-            self.pid = d.getPid(pkgName=self.pkgName, deviceId=self.deviceId)[0].split(':')[0]
+            self.pid = str(list(PidCache.get(self.deviceId, self.pkgName).processes())[0])
+        if self.platform == Platform.Android:
+            self.probes = DeviceProbes.get(self.deviceId)
+            self.probe = f'pid/{self.pid}/net/dev'
+            self.probes.register(self.probe, f'cat /proc/{self.pid}/net/dev')
+
+    @classmethod
+    def clear(cls):
+        cls.interfaces.clear()
+        cls.netSnapshots.clear()
+        cls.netRates.clear()
+        cls.uidBackends.clear()
+        cls.netstatsReads.clear()
+
+    @staticmethod
+    def parseNetDev(output):
+        """parse every interface of /proc/net/dev into {interface: (recv bytes, send bytes)}"""
+        counters = {}
+        for line in output.split('\n'):
+            if ':' not in line:
+                continue
+            name, data = line.split(':', 1)
+            toks = data.split()
+            if len(toks) >= 9 and toks[0].isdigit() and toks[8].isdigit():
+                counters[name.strip()] = (int(toks[0]), int(toks[8]))
+        return counters
+
+    @classmethod
+    def discoverInterface(cls, counters, prefixes):
+        """pick the interface with the most traffic among those starting with one of the prefixes"""
+        candidates = [name for name in counters if name.startswith(prefixes)]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda name: (sum(counters[name]), name.endswith('0')))
+
+    def getInterface(self, counters, wifi=True):
+        """resolve the wifi or cellular interface once per device, again only if it disappears"""
+        kind = 'wifi' if wifi else 'cell'
+        cached = self.interfaces.setdefault(self.deviceId, {})
+        if cached.get(kind) not in counters:
+            net = self.discoverInterface(counters, self.WIFI_INTERFACES if wifi else self.CELL_INTERFACES)
+            if net is None:
+                raise Exception('no {} interface in /proc/{}/net/dev'.format(kind, self.pid))
+            cached[kind] = net
+            logger.info('[Network] {} interface: {}'.format(kind, net))
+        return cached[kind]
+
+    def getRate(self, key, monotonic, link, counters):
+        """send/recv rate of (recv bytes, send bytes) counters against the previous reading under key, unit:KB/s"""
+        current = (monotonic, link, counters)
+        previous = self.netSnapshots.get(key)
+        if previous is not None and previous[0] == current[0]:
+            # same tick as the previous call
+            return self.netRates.get(key, (0, 0))
+        self.netSnapshots[key] = current
+        if previous is None or previous[1] != link or current[2][0] < previous[2][0] \
+                or current[2][1] < previous[2][1]:
+            # first reading, the link changed or the counters were reset
+            self.netRates[key] = (0, 0)
+            return self.netRates[key]
+        elapsed = current[0] - previous[0]
+        recNum = round((current[2][0] - previous[2][0]) / 1024 / elapsed, 2)
+        sendNum = round((current[2][1] - previous[2][1]) / 1024 / elapsed, 2)
+        self.netRates[key] = (sendNum, recNum)
+        return sendNum, recNum
 
     def getAndroidNet(self, wifi=True):
-        """Get Android send/recv data, unit:KB wlan0/rmnet0"""
+        """Get Android send/recv rate of the whole interface since the previous reading, unit:KB/s"""
+        key = (self.deviceId, self.pid, wifi)
+        try:
+            snapshot = self.probes.snapshot(names=[self.probe])
+            counters = self.parseNetDev(snapshot.get(self.probe))
+            net = self.getInterface(counters, wifi)
+            if key not in self.netSnapshots:
+                # first reading: keep it as the baseline and measure over a short window
+                self.getRate(key, snapshot.monotonic, net, counters[net])
+                time.sleep(self.BASELINE)
+                snapshot = self.probes.snapshot(max_age=0, names=[self.probe])
+                counters = self.parseNetDev(snapshot.get(self.probe))
+            sendNum, recNum = self.getRate(key, snapshot.monotonic, net, counters[net])
+        except Exception as e:
+            sendNum, recNum = 0, 0
+            self.netSnapshots.pop(key, None)
+            if len(d.getPid(self.deviceId, self.pkgName)) == 0:
+                logger.error('[Network] {} : No process found'.format(self.pkgName))
+            else:
+                logger.exception(e)
+        return sendNum, recNum
+
+    @staticmethod
+    def parseQtaguid(output, uid):
+        """sum the untagged rows of a uid in /proc/net/xt_qtaguid/stats into (recv bytes, send bytes)"""
+        recv, send = 0, 0
+        for line in output.split('\n'):
+            toks = line.split()
+            # idx iface acct_tag_hex uid_tag_int cnt_set rx_bytes rx_packets tx_bytes ...
+            if len(toks) >= 8 and toks[2] == '0x0' and toks[3] == str(uid) and toks[5].isdigit():
+                recv += int(toks[5])
+                send += int(toks[7])
+        return recv, send
+
+    @staticmethod
+    def parseNetstats(output, uid):
+        """sum the untagged history buckets of a uid in dumpsys netstats detail into (recv bytes, send bytes)"""
+        recv, send = 0, 0
+        current = False
+        for line in output.split('\n'):
+            if 'ident=' in line:
+                current = ' uid={} '.format(uid) in line and 'tag=0x0' in line
+            elif current and ' rb=' in line:
+                m = re.search(r'rb=(\d+).*tb=(\d+)', line)
+                if m:
+                    recv += int(m.group(1))
+                    send += int(m.group(2))
+        return recv, send
+
+    def getUidBackend(self):
+        """resolve the app uid and the best per-uid counter source once per process"""
+        key = (self.deviceId, self.pid)
+        if key not in self.uidBackends:
+            output = adb.shell(cmd=f'grep Uid: /proc/{self.pid}/status; '
+                                   f'[ -r /proc/net/xt_qtaguid/stats ] && echo qtaguid', deviceId=self.deviceId)
+            m = re.search(r'Uid:\s*(\d+)', output)
+            if not m:
+                m = re.search(r'userId=(\d+)', adb.shell(cmd=f'dumpsys package {self.pkgName} | grep userId=',
+                                                         deviceId=self.deviceId))
+            if not m:
+                self.uidBackends[key] = (None, 'dev')
+            elif 'qtaguid' in output:
+                self.uidBackends[key] = (int(m.group(1)), 'qtaguid')
+            else:
+                self.uidBackends[key] = (int(m.group(1)), 'netstats')
+            logger.info('[Network] {} uid: {}, counters: {}'.format(self.pkgName, *self.uidBackends[key]))
+        return self.uidBackends[key]
+
+    def getUidCounters(self, max_age=None):
+        """read the app traffic counters, returns (monotonic, (recv bytes, send bytes)) or None without a uid source"""
+        key = (self.deviceId, self.pid)
+        uid, backend = self.getUidBackend()
+        match backend:
+            case 'qtaguid':
+                probe = f'uid/{uid}/qtaguid'
+                self.probes.register(probe, f"grep ' {uid} ' /proc/net/xt_qtaguid/stats")
+                snapshot = self.probes.snapshot(max_age, names=[probe])
+                return snapshot.monotonic, self.parseQtaguid(snapshot.get(probe), uid)
+            case 'netstats':
+                monotonic, output = self.readNetstats(uid, force=max_age == 0)
+                if 'ident=' not in output:
+                    logger.warning('[Network] dumpsys netstats unavailable, using interface counters')
+                    self.uidBackends[key] = (uid, 'dev')
+                    return None
+                return monotonic, self.parseNetstats(output, uid)
+        return None
+
+    def readNetstats(self, uid, force=False):
+        """
+        dumpsys netstats is too heavy for the shared per-tick batch, it runs on its own at most every netstatsInterval
+        :return: (monotonic, output) of the latest read
+        """
+        key = (self.deviceId, uid)
+        last = self.netstatsReads.get(key)
+        if force or last is None or time.monotonic() - last[0] >= self.netstatsInterval:
+            monotonic = time.monotonic()
+            # --poll makes the service pull the kernel counters before dumping
+            output = adb.shell(cmd="dumpsys netstats --poll >/dev/null; "
+                                   "dumpsys netstats detail | grep -E 'ident=| rb='", deviceId=self.deviceId)
+            last = self.netstatsReads[key] = (monotonic, output)
+        return last
+
+    def getAndroidUidNet(self, wifi=True):
+        """Get the send/recv rate of the app uid since the previous reading, unit:KB/s"""
+        key = (self.deviceId, self.pid, 'uid')
         try:
-            net = 'wlan0' if wifi else 'rmnet0'
-            cmd = 'cat /proc/{}/net/dev |{} {}'.format(self.pid, d.filterType(), net)
-            output_pre = adb.shell(cmd=cmd, deviceId=self.deviceId)
-            if not wifi and not output_pre:
-                for phone_net in ['rmnet_data0', 'rmnet_ipa0', 'ccmni0']:
-                    cmd = f'cat /proc/{self.pid}/net/dev |{d.filterType()} {net}'
-                    output_pre = adb.shell(cmd=cmd, deviceId=self.deviceId)
-                    if output_pre:
-                        net = phone_net
-                        break
-            m_pre = re.search(r'{}:\s*(\d+)\s*\d+\s*\d+\s*\d+\s*\d+\s*\d+\s*\d+\s*\d+\s*(\d+)'.format(net), output_pre)
-            sendNum_pre = round(float(float(m_pre.group(2)) / 1024), 2)
-            recNum_pre = round(float(float(m_pre.group(1)) / 1024), 2)
-            time.sleep(0.5)
-            output_final = adb.shell(cmd=cmd, deviceId=self.deviceId)
-            m_final = re.search(r'{}:\s*(\d+)\s*\d+\s*\d+\s*\d+\s*\d+\s*\d+\s*\d+\s*\d+\s*(\d+)'.format(net),
-                                output_final)
-            sendNum_final = round(float(float(m_final.group(2)) / 1024), 2)
-            recNum_final = round(float(float(m_final.group(1)) / 1024), 2)
-            sendNum = round(float(sendNum_final - sendNum_pre), 2)
-            recNum = round(float(recNum_final - recNum_pre), 2)
+            counters = self.getUidCounters()
+            if counters is not None and key not in self.netSnapshots:
+                self.getRate(key, counters[0], 'uid', counters[1])
+                time.sleep(self.BASELINE)
+                counters = self.getUidCounters(max_age=0)
+            if counters is None:
+                return self.getAndroidNet(wifi)
+            sendNum, recNum = self.getRate(key, counters[0], 'uid', counters[1])
         except Exception as e:
             sendNum, recNum = 0, 0
+            self.netSnapshots.pop(key, None)
             if len(d.getPid(self.deviceId, self.pkgName)) == 0:
                 logger.error('[Network] {} : No process found'.format(self.pkgName))
             else:
@@ -418,20 +1000,16 @@ class Network(metaclass=Singleton):
         return sendNum, recNum
 
     def setAndroidNet(self, wifi=True):
+        """Get Android send/recv totals of the app uid, or of the active interface without a uid source, unit:KB"""
         try:
-            net = 'wlan0' if wifi else 'rmnet0'
-            cmd = f'cat /proc/{self.pid}/net/dev |{d.filterType()} {net}'
-            output_pre = adb.shell(cmd=cmd, deviceId=self.deviceId)
-            if not wifi and not output_pre:
-                for phone_net in ['rmnet_data0', 'rmnet_ipa0', 'ccmni0']:
-                    cmd = f'cat /proc/{self.pid}/net/dev |{d.filterType()} {net}'
-                    output_pre = adb.shell(cmd=cmd, deviceId=self.deviceId)
-                    if output_pre:
-                        net = phone_net
-                        break
-            m = re.search(r'{}:\s*(\d+)\s*\d+\s*\d+\s*\d+\s*\d+\s*\d+\s*\d+\s*\d+\s*(\d+)'.format(net), output_pre)
-            sendNum = round(float(float(m.group(2)) / 1024), 2)
-            recNum = round(float(float(m.group(1)) / 1024), 2)
+            counters = self.getUidCounters(max_age=0)
+            if counters is not None:
+                recNum, sendNum = counters[1]
+            else:
+                counters = self.parseNetDev(self.probes.snapshot(max_age=0, names=[self.probe]).get(self.probe))
+                recNum, sendNum = counters[self.getInterface(counters, wifi)]
+            sendNum = round(float(sendNum / 1024), 2)
+            recNum = round(float(recNum / 1024), 2)
         except Exception as e:
             sendNum, recNum = 0, 0
             if len(d.getPid(self.deviceId, self.pkgName)) == 0:
@@ -450,7 +1028,7 @@ class Network(metaclass=Singleton):
 
     def getNetWorkData(self, wifi=True, noLog=False):
         """Get the upflow and downflow data, unit:KB"""
-        sendNum, recNum = self.getAndroidNet(wifi) if self.platform == Platform.Android else self.getiOSNet()
+        sendNum, recNum = self.getAndroidUidNet(wifi) if self.platform == Platform.Android else self.getiOSNet()
         if noLog is False:
             apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
             f.add_log(os.path.join(f.report_dir, 'upflow.log'), apm_time, sendNum)
@@ -459,35 +1037,50 @@ class Network(metaclass=Singleton):
 
 
 class FPS(metaclass=Singleton):
-    AndroidFPS = None
+    # (deviceId, pkgName, surfaceview, timestats): FPS, one Android collector per device, package and frame source
+    AndroidFPS = {}
 
     @classmethod
     def getObject(cls, *args, **kwargs):
         if kwargs['platform'] == Platform.Android:
-            if cls.AndroidFPS is None:
-                cls.AndroidFPS = FPS(*args, **kwargs)
-            return cls.AndroidFPS
+            key = (kwargs['deviceId'], kwargs['pkgName'], kwargs.get('surfaceview', True),
+                   kwargs.get('timestats', False))
+            if key not in cls.AndroidFPS:
+                cls.AndroidFPS[key] = FPS(*args, **kwargs)
+            return cls.AndroidFPS[key]
         return FPS(*args, **kwargs)
 
     @classmethod
     def clear(cls):
-        cls.AndroidFPS = None
+        cls.AndroidFPS.clear()
+        FrameStreamCollector.stop_all()
+        TimeStatsCollector.stop_all()
 
-    def __init__(self, pkgName, deviceId, platform=Platform.Android, surfaceview=True):
+    def __init__(self, pkgName, deviceId, platform=Platform.Android, surfaceview=True, timestats=False):
         self.pkgName = pkgName
         self.deviceId = deviceId
         self.platform = platform
         self.surfaceview = surfaceview
+        # SurfaceFlinger timestats backend, android 10+ only
+        self.timestats = timestats and platform == Platform.Android and TimeStatsCollector.supported(deviceId)
         self.apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
         self.monitors = None
+        # device vsync time of the newest frame already reported
+        self.last_frame = None
 
     def getAndroidFps(self, noLog=False):
-        """get Android Fps, unit:HZ"""
+        """get Android Fps of the frames since the previous call, unit:HZ"""
         try:
-            monitors = FPSMonitor(device_id=self.deviceId, package_name=self.pkgName, frequency=2,
-                                  surfaceview=self.surfaceview, start_time=TimeUtils.getCurrentTimeUnderline())
-            monitors.start()
-            fps, jank, bigjank, collect_jank_time, collect_Stutter = monitors.stop()
+            if self.timestats:
+                stream = None
+                fps, jank, bigjank, collect_jank_time, _ = TimeStatsCollector.get(self.deviceId, self.pkgName).stats()
+            else:
+                stream = FrameStreamCollector.get(self.deviceId, self.pkgName, self.surfaceview)
+                fps, jank, bigjank, collect_jank_time, _, self.last_frame = stream.stats(since=self.last_frame)
+            session = FPSSession.get(self.deviceId, self.pkgName)
+            collect_Stutter = session.add_jank_time(collect_jank_time, time.time())
+            session.fps, session.jank, session.bigjank = fps, jank, bigjank
+            session.jank_time, session.stutter = collect_jank_time, collect_Stutter
             if noLog is False:
                 apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
                 f.add_log(os.path.join(f.report_dir, 'fps.log'), apm_time, fps)
@@ -495,14 +1088,26 @@ class FPS(metaclass=Singleton):
                 f.add_log(os.path.join(f.report_dir, 'bigjank.log'), apm_time, bigjank)
                 f.add_log(os.path.join(f.report_dir, 'collect_jank_time.log'), apm_time, collect_jank_time)
                 f.add_log(os.path.join(f.report_dir, 'Stutter.log'), apm_time, collect_Stutter)
+            if self.surfaceview is False and stream is not None:
+                self.getAndroidFrameStats(stream, noLog)
         except Exception as e:
-            fps, jank, bigjank, collect_Stutter = 0
+            fps, jank, bigjank, collect_Stutter = 0, 0, 0, 0
             if len(d.getPid(self.deviceId, self.pkgName)) == 0:
                 logger.error('[FPS] {} : No process found'.format(self.pkgName))
             else:
                 logger.exception(e)
         return fps, jank, bigjank, collect_Stutter
 
+    def getAndroidFrameStats(self, stream, noLog=False):
+        """frame time percentiles and per-stage durations of the gfxinfo frames since the previous call, unit:ms"""
+        summary = frame_analysis.framestats_summary(stream.drain_framestats())
+        if summary and noLog is False:
+            apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
+            for name, value in summary.items():
+                if name != 'frames':
+                    f.add_log(os.path.join(f.report_dir, 'frame_{}.log'.format(name)), apm_time, value)
+        return summary
+
     def getiOSFps(self, noLog=False):
         """get iOS Fps"""
         apm = iosAPM(self.pkgName, self.deviceId)
@@ -510,7 +1115,7 @@ class FPS(metaclass=Singleton):
         if noLog is False:
             apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
             f.add_log(os.path.join(f.report_dir, 'fps.log'), apm_time, fps)
-        return fps, 0
+        return fps, 0, 0, 0
 
     def getFPS(self, noLog=False):
         """get fps、jank、bigjank"""
@@ -524,10 +1129,32 @@ class FPS(metaclass=Singleton):
 
 
 class GPU(metaclass=Singleton):
+    # (kind, path) by priority, kind tells how the file reads
+    LOAD_SOURCES = (
+        ('percentage', '/sys/class/kgsl/kgsl-3d0/gpu_busy_percentage'),
+        ('gpubusy', '/sys/class/kgsl/kgsl-3d0/gpubusy'),
+        ('percentage', '/sys/kernel/gpu/gpu_busy'),
+        ('percentage', '/sys/class/misc/mali0/device/utilization'),
+    )
+    # (unit in Hz, path) by priority
+    FREQ_SOURCES = (
+        (1, '/sys/class/kgsl/kgsl-3d0/gpuclk'),
+        (1000000, '/sys/kernel/gpu/gpu_clock'),
+        (1, '/sys/class/misc/mali0/device/clock'),
+    )
+    DEVFREQ_NAMES = ('gpu', 'kgsl', 'mali', 'g3d')
+    # deviceId: {'load': (kind, cmd) or None, 'freq': (unit, cmd) or None}
+    sources = {}
+
     def __init__(self, pkgName, deviceId, platform=Platform.Android):
         self.pkgName = pkgName
         self.deviceId = deviceId
         self.platform = platform
+        self.freq = 0
+
+    @classmethod
+    def clear(cls):
+        cls.sources.clear()
 
     def getGPU(self, noLog=False):
         if self.platform == Platform.Android:
@@ -544,49 +1171,149 @@ class GPU(metaclass=Singleton):
             f.add_log(os.path.join(f.report_dir, 'gpu.log'), apm_time, gpu)
         return gpu
 
+    @staticmethod
+    def parseGpuLoad(kind, output):
+        """gpubusy is 'busy total', devfreq load is 'load@freqHz', the others start with the percentage"""
+        values = [int(value) for value in re.findall(r'\d+', output)]
+        if not values:
+            return None
+        if kind == 'gpubusy':
+            return round(values[0] / values[1] * 100, 2) if len(values) > 1 and values[1] > 0 else 0
+        return round(float(values[0]), 2)
+
+    def getGpuSources(self):
+        """find the readable GPU load and frequency files of the device once and cache them"""
+        if self.deviceId in self.sources:
+            return self.sources[self.deviceId]
+        paths = ' '.join(path for _, path in self.LOAD_SOURCES + self.FREQ_SOURCES)
+        names = '|'.join('*{}*'.format(name) for name in self.DEVFREQ_NAMES)
+        cmd = (f'for p in {paths}; do cat $p >/dev/null 2>&1 && echo $p; done; '
+               f'for p in /sys/class/devfreq/*; do case $p in {names}) '
+               f'for n in load cur_freq; do cat $p/$n >/dev/null 2>&1 && echo $p/$n; done;; esac; done')
+        found = adb.shell(cmd=cmd, deviceId=self.deviceId).split()
+        load = next(((kind, f'cat {path}') for kind, path in self.LOAD_SOURCES if path in found), None)
+        freq = next(((unit, f'cat {path}') for unit, path in self.FREQ_SOURCES if path in found), None)
+        if load is None:
+            load = next((('percentage', f'cat {path}') for path in found if path.endswith('/load')), None)
+        if freq is None:
+            freq = next(((1, f'cat {path}') for path in found if path.endswith('/cur_freq')), None)
+        if load is None:
+            # kgsl is root only on some builds
+            cmd = 'su -c cat /sys/class/kgsl/kgsl-3d0/gpubusy'
+            if self.parseGpuLoad('gpubusy', adb.shell(cmd=cmd, deviceId=self.deviceId)) is not None:
+                load = ('gpubusy', cmd)
+            else:
+                logger.warning('[GPU] no readable gpu load source on {}'.format(self.deviceId))
+        self.sources[self.deviceId] = {'load': load, 'freq': freq}
+        logger.info('[GPU] {} sources: {}'.format(self.deviceId, self.sources[self.deviceId]))
+        return self.sources[self.deviceId]
+
     def getAndroidGPU(self, noLog=False):
+        """Get the Android GPU load in % and frequency in MHz from the batched tick, returns the load"""
+        gpu_info, gpu_freq = 0, 0
         try:
-            cmd = "cat /sys/class/kgsl/kgsl-3d0/gpubusy"
-            gpu_info = adb.new_shell(cmd=cmd)
-            # print(gpu_info)
-            if len(gpu_info) != 0:
-                # print(gpu_info)
-                res_n = gpu_info.split(" ")
-                for i in range(len(res_n) - 1, -1, -1):
-                    if res_n[i] == '':
-                        res_n.pop(i)
-                try:
-                    gpu_info = round(int(res_n[0]) / int(res_n[1]) * 100, 2)
-                except:
-                    gpu_info = 0
-                # logger.info("获取到的gpu信息是：{}".format(gpu_info))
-            else:
-                cmd = "su -c cat /sys/class/kgsl/kgsl-3d0/gpubusy"
-                gpu_info = adb.new_shell(cmd=cmd)
-                # print(gpu_info)
-                if len(gpu_info) != 0:
-                    # print(gpu_info)
-                    res_n = gpu_info.split(" ")
-                    for i in range(len(res_n) - 1, -1, -1):
-                        if res_n[i] == '':
-                            res_n.pop(i)
-                    try:
-                        gpu_info = round(int(res_n[0]) / int(res_n[1]) * 100, 2)
-                    except:
-                        gpu_info = 0
-                    # logger.info("获取到的gpu信息是：{}".format(gpu_info))
+            sources = self.getGpuSources()
+            probes = DeviceProbes.get(self.deviceId)
+            if sources['load'] is not None:
+                probes.register('gpu/load', sources['load'][1])
+            if sources['freq'] is not None:
+                probes.register('gpu/freq', sources['freq'][1])
+            snapshot = probes.snapshot(names=['gpu/load', 'gpu/freq'])
+            if sources['load'] is not None:
+                gpu_info = self.parseGpuLoad(sources['load'][0], snapshot.get('gpu/load')) or 0
+            if sources['freq'] is not None:
+                freq = re.search(r'\d+', snapshot.get('gpu/freq'))
+                gpu_freq = round(int(freq.group()) * sources['freq'][0] / 1000000, 2) if freq else 0
         except Exception as e:
-            gpu_info = 1
-            # logger.info("获取到的gpu信息是：{}".format(e))
+            logger.exception(e)
         if noLog is False:
             apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
-            # logger.info("获取到的gpu信息是：{}".format(gpu_info))
-            if gpu_info == "":
-                gpu_info = 0
             f.add_log(os.path.join(f.report_dir, 'gpu.log'), apm_time, gpu_info)
+            if gpu_freq:
+                f.add_log(os.path.join(f.report_dir, 'gpu_freq.log'), apm_time, gpu_freq)
+        self.freq = gpu_freq
         return round(gpu_info, 2)
 
 
+class Thermal(metaclass=Singleton):
+    ZONES = '/sys/class/thermal/thermal_zone*'
+    COOLING = '/sys/class/thermal/cooling_device*'
+    # separates the zone types from the cooling device types in one shell output
+    DELIMITER = '__SOLOX_COOLING__'
+    # deviceId: ({zone index: series name}, {cooling index: (type, max_state)})
+    names = {}
+
+    def __init__(self, deviceId, platform=Platform.Android):
+        self.deviceId = deviceId
+        self.platform = platform
+
+    @classmethod
+    def clear(cls):
+        cls.names.clear()
+
+    @staticmethod
+    def parseIndexed(output):
+        """parse '<index> <values...>' lines into {index: [values]}"""
+        values = {}
+        for line in output.split('\n'):
+            toks = line.split()
+            if toks and toks[0].isdigit():
+                values[int(toks[0])] = toks[1:]
+        return values
+
+    def getThermalNames(self):
+        """resolve the thermal zone and cooling device types once per device"""
+        if self.deviceId not in self.names:
+            cmd = (f'for z in {self.ZONES}; do echo "${{z##*thermal_zone}} $(cat $z/type)"; done; echo {self.DELIMITER}; '
+                   f'for c in {self.COOLING}; do echo "${{c##*cooling_device}} $(cat $c/type) $(cat $c/max_state)"; done')
+            zonePart, _, coolingPart = adb.shell(cmd=cmd, deviceId=self.deviceId).partition(self.DELIMITER)
+            zones, seen = {}, set()
+            for index, toks in sorted(self.parseIndexed(zonePart).items()):
+                name = re.sub(r'[^\w.-]', '_', toks[0]) if toks else 'zone{}'.format(index)
+                # a few kernels reuse the same type for several zones
+                if name in seen:
+                    name = '{}_{}'.format(name, index)
+                seen.add(name)
+                zones[index] = name
+            cooling = {index: (toks[0], int(toks[1]) if len(toks) > 1 and toks[1].isdigit() else 0)
+                       for index, toks in self.parseIndexed(coolingPart).items() if toks}
+            self.names[self.deviceId] = (zones, cooling)
+        return self.names[self.deviceId]
+
+    def getThermal(self, noLog=False):
+        """
+        Get every thermal zone temperature and the cooling devices state in one batched read
+        :return: {zone: temperature in °C}, {cooling device: (cur_state, max_state)}
+        """
+        temperatures, cooling = {}, {}
+        if self.platform != Platform.Android:
+            return temperatures, cooling
+        try:
+            zoneNames, coolingNames = self.getThermalNames()
+            probes = DeviceProbes.get(self.deviceId)
+            probes.register('thermal/zones', f'for z in {self.ZONES}; do echo "${{z##*thermal_zone}} $(cat $z/temp)"; done')
+            probes.register('thermal/cooling',
+                            f'for c in {self.COOLING}; do echo "${{c##*cooling_device}} $(cat $c/cur_state)"; done')
+            snapshot = probes.snapshot(names=['thermal/zones', 'thermal/cooling'])
+            for index, toks in self.parseIndexed(snapshot.get('thermal/zones')).items():
+                if index in zoneNames and toks and toks[0].lstrip('-').isdigit():
+                    value = int(toks[0])
+                    # millidegrees on most kernels, whole degrees on a few
+                    temperatures[zoneNames[index]] = round(value / 1000, 2) if abs(value) >= 1000 else value
+            for index, toks in self.parseIndexed(snapshot.get('thermal/cooling')).items():
+                if index in coolingNames and toks and toks[0].isdigit():
+                    name, maxState = coolingNames[index]
+                    cooling['{}_{}'.format(name, index)] = (int(toks[0]), maxState)
+            if noLog is False:
+                apm_time = datetime.datetime.now().strftime('%H:%M:%S.%f')
+                for name, temperature in temperatures.items():
+                    f.add_log(os.path.join(f.report_dir, 'thermal_{}.log'.format(name)), apm_time, temperature)
+                f.add_record(os.path.join(f.report_dir, 'cooling.log'), apm_time, cooling)
+        except Exception as e:
+            logger.exception(e)
+        return temperatures, cooling
+
+
 class iosAPM(metaclass=Singleton):
 
     def __init__(self, pkgName, deviceId):
@@ -625,38 +1352,72 @@ class iosAPM(metaclass=Singleton):
 
 
 class initPerformanceService(object):
-    CONFIG_DIR = os.path.dirname(os.path.realpath(__file__))
-    CONIFG_PATH = os.path.join(CONFIG_DIR, 'config.json')
+    """Run switch of monitoring sessions, see solox.public.control.RunControl"""
+    session = 'default'
 
     @classmethod
-    def get_status(cls):
-        config_json = open(file=cls.CONIFG_PATH, mode='r').read()
-        run_switch = json.loads(config_json).get('run_switch')
-        return run_switch
+    def get_status(cls, session=None):
+        """status of one session, without a session 'on' while any session runs"""
+        if session is None:
+            return RunControl.status_all()
+        return RunControl.get(session).status()
 
     @classmethod
-    def start(cls):
-        config_json = dict()
-        config_json['run_switch'] = 'on'
-        with open(cls.CONIFG_PATH, "w") as file:
-            json.dump(config_json, file)
+    def start(cls, session=None):
+        RunControl.get(session or cls.session).start()
 
     @classmethod
-    def stop(cls):
-        config_json = dict()
-        config_json['run_switch'] = 'off'
-        with open(cls.CONIFG_PATH, "w") as file:
-            json.dump(config_json, file)
-        logger.info('stop solox success')
+    def stop(cls, session=None):
+        """
+        Stop monitoring, from this process or from any other python process on the same machine
+        :param session: name of one session, None stops every session
+        """
+        RunControl.stop_all(session)
         return True
 
 
 class AppPerformanceMonitor(initPerformanceService):
     """for python api"""
+    # seconds between two readings of each metric
+    INTERVALS = {
+        'cpu': 1.0,
+        'cpuFreq': 1.0,
+        'memory': 1.0,
+        'battery': 1.0,
+        'network': 1.0,
+        'fps': 1.0,
+        'gpu': 1.0,
+        'thermal': 1.0,
+        'snapshot': 1.0
+    }
+    # (min, max) seconds of adaptive sampling, an interval backs off to max while the metric is stable
+    ADAPTIVE_BOUNDS = {
+        'cpu': (0.5, 5.0),
+        'cpuFreq': (0.5, 5.0),
+        'memory': (1.0, 5.0),
+        'battery': (2.0, 10.0),
+        'network': (0.5, 5.0),
+        'fps': (0.5, 5.0),
+        'gpu': (0.5, 5.0),
+        'thermal': (1.0, 10.0),
+        'snapshot': (0.5, 5.0)
+    }
+    # crossing one of these levels bursts the sampling back to its min interval
+    ADAPTIVE_THRESHOLDS = {
+        'cpu': {'appCpuRate': 80},
+        'fps': {'fps': 30},
+        'battery': {'temperature': 40},
+        'snapshot': {'cpu.appCpuRate': 80, 'fps.fps': 30, 'battery.temperature': 40}
+    }
+    # readings left out of the change detection, they jitter without the app doing anything
+    ADAPTIVE_IGNORE = {
+        'cpu': ('systemCpuRate', 'threads'),
+        'snapshot': ('tick', 'cpu.systemCpuRate', 'cpu.threads')
+    }
 
     def __init__(self, pkgName=None, platform=Platform.Android, deviceId=None,
                  surfaceview=True, noLog=True, pid=None, record=False, collect_all=False,
-                 duration=0):
+                 duration=0, aggregate=False, timestats=False, session=None, snapshot=False, adaptive=False):
         self.pkgName = pkgName
         self.deviceId = deviceId
         self.platform = platform
@@ -666,133 +1427,224 @@ class AppPerformanceMonitor(initPerformanceService):
         self.record = record
         self.collect_all = collect_all
         self.duration = duration
+        self.aggregate = aggregate
+        self.timestats = timestats
+        self.snapshot = snapshot
+        # True, or {metric: (min, max)} overriding ADAPTIVE_BOUNDS
+        self.adaptive = adaptive
         self.end_time = time.time() + self.duration
+        # sessions monitoring different devices or apps start and stop independently
+        self.session = session or '{}_{}'.format(self.deviceId, self.pkgName)
+        self.control = RunControl.get(self.session)
         d.devicesCheck(platform=self.platform, deviceid=self.deviceId, pkgname=self.pkgName)
-        self.start()
+        self.start(self.session)
 
-    def collectCpu(self):
-        _cpu = CPU(self.pkgName, self.deviceId, self.platform, pid=self.pid)
-        result = {}
-        while self.get_status() == 'on':
-            appCpuRate, systemCpuRate = _cpu.getCpuRate(noLog=self.noLog)
-            result = {'appCpuRate': appCpuRate, 'systemCpuRate': systemCpuRate}
-            logger.info(f'cpu: {result}')
-            if self.collect_all is False:
-                break
-            if self.duration > 0 and time.time() > self.end_time:
-                break
+    def policy(self, name):
+        """AdaptivePolicy of a metric when adaptive sampling is on, else None"""
+        if not self.adaptive:
+            return None
+        bounds = dict(self.ADAPTIVE_BOUNDS)
+        if isinstance(self.adaptive, dict):
+            bounds.update(self.adaptive)
+        min_interval, max_interval = bounds.get(name, (self.INTERVALS[name], self.INTERVALS[name]))
+        return AdaptivePolicy(min_interval, max_interval, thresholds=self.ADAPTIVE_THRESHOLDS.get(name),
+                              ignore=self.ADAPTIVE_IGNORE.get(name, ()))
+
+    def collect(self, sample, name):
+        """Take one reading, or keep sampling the metric on its interval when collect_all is set"""
+        result, previous = {}, None
+        policy = self.policy(name)
+        interval = policy.min_interval if policy else self.INTERVALS[name]
+        if self.collect_all is False:
+            return sample() if self.get_status(self.session) == 'on' else result
+        with self.control.listening():
+            while self.get_status(self.session) == 'on':
+                result = sample()
+                if self.duration > 0 and time.time() > self.end_time:
+                    break
+                if policy:
+                    interval, previous = policy.next(interval, previous, result), result
+                if self.control.wait(interval):
+                    break
         return result
 
-    def collectCpuFreq(self):
+    def sampleCpu(self):
+        _cpu = CPU(self.pkgName, self.deviceId, self.platform, pid=self.pid, aggregate=self.aggregate)
+        appCpuRate, systemCpuRate = _cpu.getCpuRate(noLog=self.noLog)
+        result = {'appCpuRate': appCpuRate, 'systemCpuRate': systemCpuRate}
+        if self.platform == Platform.Android:
+            result['threads'] = _cpu.getAndroidThreadCpu(noLog=self.noLog)
+        logger.info(f'cpu: {result}')
+        return result
+
+    def sampleCpuFreq(self):
         _cpu = CPU(self.pkgName, self.deviceId, self.platform, pid=self.pid)
-        result = {}
-        while self.get_status() == 'on':
-            cpuFreq = _cpu.getCpuFreq(noLog=self.noLog)
-            result = {'cpuFreq': cpuFreq}
-            logger.info(f'cpuFreq: {result}')
-            if self.collect_all is False:
-                break
-            if self.duration > 0 and time.time() > self.end_time:
-                break
+        result = {'cpuFreq': _cpu.getCpuFreq(noLog=self.noLog)}
+        logger.info(f'cpuFreq: {result}')
         return result
 
-    def collectMemory(self):
-        _memory = Memory(self.pkgName, self.deviceId, self.platform, pid=self.pid)
-        result = {}
-        while self.get_status() == 'on':
-            total, swap = _memory.getProcessMemory(noLog=self.noLog)
-            result = {'total': total, 'swap': swap}
-            logger.info(f'memory: {result}')
-            if self.collect_all is False:
-                break
-            if self.duration > 0 and time.time() > self.end_time:
-                break
+    def sampleMemory(self):
+        _memory = Memory(self.pkgName, self.deviceId, self.platform, pid=self.pid, aggregate=self.aggregate)
+        total, swap, detail = _memory.getMemory(noLog=self.noLog)
+        result = {'total': total, 'swap': swap}
+        logger.info(f'memory: {result}')
+        if detail:
+            result['detail'] = detail
+            logger.info(f'memory detail: {detail}')
         return result
 
-    def collectMemoryDetail(self):
+    def sampleMemoryDetail(self):
+        if self.platform == Platform.iOS:
+            return {}
         _memory = Memory(self.pkgName, self.deviceId, self.platform, pid=self.pid)
-        result = {}
-        while self.get_status() == 'on':
-            if self.platform == Platform.iOS:
-                break
-            result = _memory.getAndroidMemoryDetail(noLog=self.noLog)
-            logger.info(f'memory detail: {result}')
-            if self.collect_all is False:
-                break
-            if self.duration > 0 and time.time() > self.end_time:
-                break
+        result = _memory.getAndroidMemoryDetail(noLog=self.noLog)
+        logger.info(f'memory detail: {result}')
         return result
 
-    def collectBattery(self):
+    def sampleBattery(self):
         _battery = Battery(self.deviceId, self.platform)
-        result = {}
-        while self.get_status() == 'on':
-            final = _battery.getBattery(noLog=self.noLog)
-            if self.platform == Platform.Android:
-                result = {'level': final[0], 'temperature': final[1]}
-            else:
-                result = {'temperature': final[0], 'current': final[1], 'voltage': final[2], 'power': final[3]}
-            logger.info(f'battery: {result}')
-            if self.collect_all is False:
-                break
-            if self.duration > 0 and time.time() > self.end_time:
-                break
+        final = _battery.getBattery(noLog=self.noLog)
+        if self.platform == Platform.Android:
+            result = {'level': final[0], 'temperature': final[1]}
+        else:
+            result = {'temperature': final[0], 'current': final[1], 'voltage': final[2], 'power': final[3]}
+        logger.info(f'battery: {result}')
         return result
 
-    def collectNetwork(self, wifi=True):
+    def sampleNetwork(self, wifi=True):
         _network = Network(self.pkgName, self.deviceId, self.platform, pid=self.pid)
-        if self.noLog is False and self.platform == Platform.Android:
-            data = _network.setAndroidNet(wifi=wifi)
-            f.record_net('pre', data[0], data[1])
-        result = {}
-        while self.get_status() == 'on':
-            upFlow, downFlow = _network.getNetWorkData(wifi=wifi, noLog=self.noLog)
-            result = {'send': upFlow, 'recv': downFlow}
-            logger.info(f'network: {result}')
-            if self.collect_all is False:
-                break
-            if self.duration > 0 and time.time() > self.end_time:
-                break
+        upFlow, downFlow = _network.getNetWorkData(wifi=wifi, noLog=self.noLog)
+        result = {'send': upFlow, 'recv': downFlow}
+        logger.info(f'network: {result}')
         return result
 
-    def collectFps(self):
-        _fps = FPS(self.pkgName, self.deviceId, self.platform, self.surfaceview)
-        result = {}
-        while self.get_status() == 'on':
-            fps, jank = _fps.getFPS(noLog=self.noLog)
-            result = {'fps': fps, 'jank': jank}
-            logger.info(f'fps: {result}')
-            if self.collect_all is False:
-                break
-            if self.duration > 0 and time.time() > self.end_time:
-                break
+    def sampleFps(self):
+        _fps = FPS(self.pkgName, self.deviceId, self.platform, self.surfaceview, timestats=self.timestats)
+        fps, jank, bigjank, stutter = _fps.getFPS(noLog=self.noLog)
+        result = {'fps': fps, 'jank': jank, 'bigjank': bigjank, 'stutter': stutter}
+        logger.info(f'fps: {result}')
         return result
 
-    def collectGpu(self):
+    def sampleGpu(self):
         _gpu = GPU(self.pkgName, self.deviceId, self.platform)
-        result = {}
-        while self.get_status() == 'on':
-            gpu = _gpu.getGPU(noLog=True)
-            if gpu:
-                result = {'gpu': gpu}
-            logger.info(f'gpu: {result}')
-            # print(gpu)
-            if self.collect_all is False:
-                break
-            if self.duration > 0 and time.time() > self.end_time:
-                break
+        gpu = _gpu.getGPU(noLog=self.noLog)
+        result = {'gpu': gpu or 0}
+        logger.info(f'gpu: {result}')
         return result
 
+    def sampleThermal(self):
+        if self.platform == Platform.iOS:
+            return {}
+        temperatures, cooling = Thermal(self.deviceId, self.platform).getThermal(noLog=self.noLog)
+        result = {'thermal': temperatures, 'cooling': cooling}
+        logger.info(f'thermal: {result}')
+        return result
+
+    def samplers(self):
+        """{metric: one-shot sampler} of every metric collectAll records"""
+        samplers = {
+            'cpu': self.sampleCpu,
+            'cpuFreq': self.sampleCpuFreq,
+            'memory': self.sampleMemory,
+            'battery': self.sampleBattery,
+            'network': self.sampleNetwork,
+            'fps': self.sampleFps,
+            'gpu': self.sampleGpu
+        }
+        if self.platform == Platform.Android:
+            samplers['thermal'] = self.sampleThermal
+        return samplers
+
+    def sampleSnapshot(self):
+        """
+        Sample every metric inside one tick and record them as one row of snapshot.log,
+        on Android all device reads of the tick come from the same batched probe read
+        :return: {'tick': monotonic seconds, 'time': wall clock, metric: reading, ...}
+        """
+        tick, apm_time = time.monotonic(), datetime.datetime.now().strftime('%H:%M:%S.%f')
+        row = {'tick': round(tick, 3), 'time': apm_time}
+
+        def sampleAll():
+            for name, sample in self.samplers().items():
+                # a failing metric leaves its column empty, the rest of the row is still recorded
+                try:
+                    row[name] = sample()
+                except Exception as e:
+                    row[name] = None
+                    logger.exception(e)
+
+        if self.platform == Platform.Android:
+            with DeviceProbes.get(self.deviceId).tick():
+                sampleAll()
+        else:
+            sampleAll()
+        if self.noLog is False:
+            f.add_record(os.path.join(f.report_dir, 'snapshot.log'), apm_time, row)
+        return row
+
+    def collectCpu(self):
+        # readings are deltas against the previous one, the interval sets the sampling period
+        return self.collect(self.sampleCpu, 'cpu')
+
+    def collectCpuFreq(self):
+        return self.collect(self.sampleCpuFreq, 'cpuFreq')
+
+    def collectMemory(self):
+        return self.collect(self.sampleMemory, 'memory')
+
+    def collectMemoryDetail(self):
+        return self.collect(self.sampleMemoryDetail, 'memory')
+
+    def collectBattery(self):
+        return self.collect(self.sampleBattery, 'battery')
+
+    def collectNetwork(self, wifi=True):
+        if self.noLog is False and self.platform == Platform.Android:
+            data = Network(self.pkgName, self.deviceId, self.platform, pid=self.pid).setAndroidNet(wifi=wifi)
+            f.record_net('pre', data[0], data[1])
+        return self.collect(lambda: self.sampleNetwork(wifi=wifi), 'network')
+
+    def collectFps(self):
+        # frames stream into the collector buffer, the interval sets the reporting period
+        return self.collect(self.sampleFps, 'fps')
+
+    def collectGpu(self):
+        return self.collect(self.sampleGpu, 'gpu')
+
+    def collectThermal(self):
+        return self.collect(self.sampleThermal, 'thermal')
+
+    def collectSnapshot(self):
+        return self.collect(self.sampleSnapshot, 'snapshot')
+
+    def scheduler(self):
+        """Every metric of collectAll on one scheduler, see solox.public.scheduler"""
+        if self.platform == Platform.Android and self.pid is None:
+            # resolve the main process once so every sampler shares it
+            processes = PidCache.get(self.deviceId, self.pkgName).processes()
+            self.pid = str(next(iter(processes))) if processes else None
+        if self.noLog is False and self.platform == Platform.Android:
+            data = Network(self.pkgName, self.deviceId, self.platform, pid=self.pid).setAndroidNet()
+            f.record_net('pre', data[0], data[1])
+        scheduler = SamplingScheduler(self.deviceId, stopped=self.control.stopped)
+        if self.snapshot:
+            # one job samples every metric per tick, rows share a single timestamp
+            scheduler.add('snapshot', self.sampleSnapshot, self.INTERVALS['snapshot'], self.policy('snapshot'))
+            return scheduler
+        for name, sample in self.samplers().items():
+            scheduler.add(name, sample, self.INTERVALS[name], self.policy(name))
+        return scheduler
+
     def setPerfs(self):
         match (self.platform):
             case Platform.Android:
-                adb.shell(cmd='dumpsys battery reset', deviceId=self.deviceId)
+                Battery(self.deviceId).recoverBattery()
                 _flow = Network(self.pkgName, self.deviceId, self.platform, pid=self.pid)
                 _cpu = CPU(self.pkgName, self.deviceId, self.platform, pid=self.pid)
-                corenum = _cpu.getCpuCoreNum()
+                corenum = _cpu.getCpuCores()
                 data = _flow.setAndroidNet()
                 f.record_net('end', data[0], data[1])
-                scene = f.make_report(app=self.pkgName, devices=self.deviceId, corenum=corenum, duration=self.duration,
+                scene = f.make_report(app=self.pkgName, devices=self.deviceId, corenum=corenum,
                                       video=0, platform=self.platform, model='normal')
                 print("setPerfs()" + scene)
                 summary = f._setAndroidPerfs(scene, corenum)
@@ -800,14 +1652,20 @@ class AppPerformanceMonitor(initPerformanceService):
                 summary_dict['corenum'] = corenum
                 summary_dict['cpu_app'] = summary['cpuAppRate']
                 summary_dict['cpu_sys'] = summary['cpuSystemRate']
-                summary_dict['cpu_freq'] = summary['cpuFreq']
                 summary_dict['gpu'] = summary['gpu']
                 summary_dict['mem_total'] = summary['totalPassAvg']
                 summary_dict['mem_swap'] = summary['swapPassAvg']
+                summary_dict['maxTotalPass'] = summary['maxTotalPass']
                 summary_dict['fps'] = summary['fps']
                 summary_dict['jank'] = summary['jank']
+                summary_dict['bigjank'] = summary['bigjank']
+                summary_dict['Stutter'] = summary['Stutter']
                 summary_dict['level'] = summary['batteryLevel']
                 summary_dict['tem'] = summary['batteryTeml']
+                summary_dict['temMax'] = summary['batteryTemlMax']
+                summary_dict['temAvg'] = summary['batteryTemlAvg']
+                summary_dict['power'] = summary['batteryPowerAvg']
+                summary_dict['energy'] = summary['batteryEnergy']
                 summary_dict['net_send'] = summary['flow_send']
                 summary_dict['net_recv'] = summary['flow_recv']
                 summary_dict['net_send_avg'] = summary['flow_send_avg']
@@ -815,7 +1673,7 @@ class AppPerformanceMonitor(initPerformanceService):
                 summary_dict['net_send_total'] = summary['flow_send_total']
                 summary_dict['net_recv_total'] = summary['flow_recv_total']
                 summary_dict['cpu_charts'] = f.getCpuLog(Platform.Android, scene)
-                summary_dict['cpu_freq_charts'] = f.getCpuFreqLog(Platform.Android, scene, corenum)
+                summary_dict['cpufreq_charts'] = f.getCpuFreqLog(Platform.Android, scene, corenum)
                 summary_dict['gpu_charts'] = f.getGpuLog(Platform.Android, scene)
                 summary_dict['mem_charts'] = f.getMemLog(Platform.Android, scene)
                 summary_dict['mem_detail_charts'] = f.getMemDetailLog(Platform.Android, scene)
@@ -823,10 +1681,11 @@ class AppPerformanceMonitor(initPerformanceService):
                 summary_dict['battery_charts'] = f.getBatteryLog(Platform.Android, scene)
                 summary_dict['fps_charts'] = f.getFpsLog(Platform.Android, scene)['fps']
                 summary_dict['jank_charts'] = f.getFpsLog(Platform.Android, scene)['jank']
+                summary_dict['bigjank_charts'] = f.getFpsLog(Platform.Android, scene)['bigjank']
                 summary_dict['Stutter_charts'] = f.getFpsLog(Platform.Android, scene)['Stutter']
                 f.make_android_html(scene=scene, summary=summary_dict)
             case Platform.iOS:
-                scene = f.make_report(app=self.pkgName, devices=self.deviceId,
+                scene = f.make_report(app=self.pkgName, devices=self.deviceId, corenum=0,
                                       video=0, platform=self.platform, model='normal')
                 summary = f._setiOSPerfs(scene)
                 summary_dict = {}
@@ -854,20 +1713,14 @@ class AppPerformanceMonitor(initPerformanceService):
     def collectAll(self):
         try:
             f.clear_file()
-            process_num = 9 if self.record else 8
-            pool = multiprocessing.Pool(processes=process_num)
-            pool.apply_async(self.collectCpu)
-            pool.apply_async(self.collectCpuFreq)
-            pool.apply_async(self.collectGpu)
-            pool.apply_async(self.collectMemory)
-            pool.apply_async(self.collectMemoryDetail)
-            pool.apply_async(self.collectBattery)
-            pool.apply_async(self.collectFps)
-            pool.apply_async(self.collectNetwork)
             if self.record:
-                pool.apply_async(Scrcpy.start_record, (self.deviceId))
-            pool.close()
-            pool.join()
+                Scrcpy.start_record(self.deviceId)
+            with self.control.listening():
+                try:
+                    self.scheduler().run(duration=self.duration)
+                finally:
+                    # stop the frame collectors and turn timestats off on the device again
+                    FPS.clear()
             self.setPerfs()
         except KeyboardInterrupt:
             Scrcpy.stop_record()
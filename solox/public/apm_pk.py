@@ -30,7 +30,7 @@ class CPU_PK:
 
     def getTotalCpuStat(self, deviceId):
         """get the total cpu usage at a certain time"""
-        cmd = 'cat /proc/stat |{} ^cpu'.format(d.filterType())
+        cmd = 'cat /proc/stat | grep ^cpu'
         result = adb.shell(cmd=cmd, deviceId=deviceId)
         totalCpu = 0
         lines = result.split('\n')
@@ -45,7 +45,7 @@ class CPU_PK:
 
     def getIdleCpuStat(self, deviceId):
         """get the idle cpu usage at a certain time"""
-        cmd = 'cat /proc/stat |{} ^cpu'.format(d.filterType())
+        cmd = 'cat /proc/stat | grep ^cpu'
         result = adb.shell(cmd=cmd, deviceId=deviceId)
         r = re.compile(r'(?<!cpu)\d+')
         toks = r.findall(result)
@@ -148,7 +148,7 @@ class Flow_PK:
     def getAndroidNet(self, pkgName, deviceId):
         """Get Android upflow and downflow data, unit:KB"""
         pid = d.getPid(pkgName=pkgName, deviceId=deviceId)[0].split(':')[0]
-        cmd = 'cat /proc/{}/net/dev |{} wlan0'.format(pid, d.filterType())
+        cmd = 'cat /proc/{}/net/dev | grep wlan0'.format(pid)
         output_pre = adb.shell(cmd=cmd, deviceId=deviceId)
         m_pre = re.search(r'wlan0:\s*(\d+)\s*\d+\s*\d+\s*\d+\s*\d+\s*\d+\s*\d+\s*\d+\s*(\d+)', output_pre)
         sendNum_pre = round(float(float(m_pre.group(2)) / 1024), 2)
@@ -190,7 +190,7 @@ class FPS_PK:
         monitors = FPSMonitor(device_id=deviceId, package_name=pkgName, frequency=1,
                               surfaceview=self.surfaceview, start_time=TimeUtils.getCurrentTimeUnderline())
         monitors.start()
-        fps, jank = monitors.stop()
+        fps = monitors.stop()[0]
         return fps
 
 
@@ -13,6 +13,7 @@ import ssl
 import xlwt
 import psutil
 import signal
+import threading
 import cv2
 from functools import wraps
 from datetime import datetime
@@ -53,21 +54,12 @@ class Devices:
 
     def getDeviceIds(self):
         """Get all connected device ids"""
-        Ids = list(os.popen(f"{self.adb} devices").readlines())
-        deviceIds = []
-        for i in range(1, len(Ids) - 1):
-            id, state = Ids[i].strip().split()
-            if state == 'device':
-                deviceIds.append(id)
+        deviceIds = [id for id, state in adb.devices() if state == 'device']
         return deviceIds
 
     def getDevicesName(self, deviceId):
         """Get the device name of the Android corresponding device ID"""
-        try:
-            devices_name = os.popen(f'{self.adb} -s {deviceId} shell getprop ro.product.model').readlines()[0].strip()
-        except Exception:
-            devices_name = os.popen(f'{self.adb} -s {deviceId} shell getprop ro.product.model').buffer.readlines()[
-                0].decode("utf-8").strip()
+        devices_name = adb.shell(cmd='getprop ro.product.model', deviceId=deviceId)
         return devices_name
 
     def getDevices(self):
@@ -96,12 +88,13 @@ class Devices:
         try:
             sdkversion = self.getSdkVersion(deviceId)
             if sdkversion and int(sdkversion) < 26:
-                result = os.popen(f"{self.adb} -s {deviceId} shell ps | {self.filterType()} {pkgName}").readlines()
-                resultList = [i for i in result if i != '\n']
+                result = adb.run(cmd='ps', deviceId=deviceId).stdout.splitlines()
+                resultList = [i for i in result if pkgName in i]
                 processList = ['{}:{}'.format(process.split()[1], process.split()[8]) for process in resultList]
             else:
-                result = os.popen(f"{self.adb} -s {deviceId} shell ps -ef | {self.filterType()} {pkgName}").readlines()
-                processList = ['{}:{}'.format(process.split()[1], process.split()[7]) for process in result]
+                result = adb.run(cmd='ps -ef', deviceId=deviceId).stdout.splitlines()
+                resultList = [i for i in result if pkgName in i]
+                processList = ['{}:{}'.format(process.split()[1], process.split()[7]) for process in resultList]
             for i in range(len(processList)):
                 if processList[i].count(':') == 1:
                     index = processList.index(processList[i])
@@ -124,12 +117,12 @@ class Devices:
 
     def getPkgname(self, deviceId):
         """Get all package names of Android devices"""
-        pkginfo = os.popen(f"{self.adb} -s {deviceId} shell pm list packages --user 0")
+        pkginfo = adb.run(cmd='pm list packages --user 0', deviceId=deviceId).stdout.splitlines()
         pkglist = [p.lstrip('package').lstrip(":").strip() for p in pkginfo]
         if pkglist.__len__() > 0:
             return pkglist
         else:
-            pkginfo = os.popen(f"{self.adb} -s {deviceId} shell pm list packages")
+            pkginfo = adb.run(cmd='pm list packages', deviceId=deviceId).stdout.splitlines()
             pkglist = [p.lstrip('package').lstrip(":").strip() for p in pkginfo]
             return pkglist
 
@@ -158,7 +151,7 @@ class Devices:
         return ip
 
     def get_device_ip(self, deviceId):
-        content = os.popen(f"{self.adb} -s {deviceId} shell ip addr show wlan0").read()
+        content = adb.run(cmd='ip addr show wlan0', deviceId=deviceId).stdout
         logger.info(content)
         math_obj = re.search(r'inet\s(\d+\.\d+\.\d+\.\d+).*?wlan0', content)
         if math_obj and math_obj.group(1):
@@ -185,11 +178,11 @@ class Devices:
             case Platform.Android:
                 result['brand'] = adb.shell(cmd='getprop ro.product.brand', deviceId=deviceId)
                 result['name'] = adb.shell(cmd='getprop ro.product.model', deviceId=deviceId)
-                cmd1 = '"cat /proc/cpuinfo | grep \'processor\' | wc -l"'
+                cmd1 = 'cat /proc/cpuinfo | grep processor | wc -l'
                 result['cpuinfo'] = adb.shell(cmd=cmd1, deviceId=deviceId)
                 result['version'] = adb.shell(cmd='getprop ro.build.version.release', deviceId=deviceId)
                 result['serialno'] = adb.shell(cmd='getprop ro.serialno', deviceId=deviceId)
-                cmd = f'ip addr show wlan0 | {self.filterType()} link/ether'
+                cmd = 'ip addr show wlan0 | grep link/ether'
                 wifiadr_content = adb.shell(cmd=cmd, deviceId=deviceId)
                 result['wifiadr'] = Method._index(wifiadr_content.split(), 1, '')
             case Platform.iOS:
@@ -204,7 +197,7 @@ class Devices:
         return result
 
     def getCurrentActivity(self, deviceId):
-        result = adb.shell(cmd='dumpsys window | {} mCurrentFocus'.format(self.filterType()), deviceId=deviceId)
+        result = adb.shell(cmd='dumpsys window | grep mCurrentFocus', deviceId=deviceId)
         if result.__contains__('mCurrentFocus'):
             activity = str(result).split(' ')[-1].replace('}', '')
             return activity
@@ -224,6 +217,42 @@ class Devices:
         return result
 
 
+class PidCache(object):
+    """Processes of a package on a device, refreshed periodically as they come and go"""
+    REFRESH = 5.0
+    _instances = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, deviceId, pkgName):
+        with cls._lock:
+            key = (deviceId, pkgName)
+            if key not in cls._instances:
+                cls._instances[key] = cls(deviceId, pkgName)
+            return cls._instances[key]
+
+    @classmethod
+    def clear_all(cls):
+        with cls._lock:
+            cls._instances.clear()
+
+    def __init__(self, deviceId, pkgName):
+        self.deviceId = deviceId
+        self.pkgName = pkgName
+        self.expires = 0
+        self.value = {}
+        self.lock = threading.Lock()
+
+    def processes(self, force=False):
+        """Return {pid: process name}, the main process first"""
+        with self.lock:
+            if force or time.monotonic() >= self.expires:
+                processList = Devices().getPid(deviceId=self.deviceId, pkgName=self.pkgName)
+                self.value = {int(process.split(':', 1)[0]): process.split(':', 1)[1] for process in processList}
+                self.expires = time.monotonic() + self.REFRESH
+            return dict(self.value)
+
+
 class File:
 
     def __init__(self, fileroot='.'):
@@ -289,6 +318,8 @@ class File:
                                            corenum=summary['corenum'],
                                            temMax=summary['temMax'],
                                            temAvg=summary['temAvg'],
+                                           power=summary.get('power', 0),
+                                           energy=summary.get('energy', 0),
                                            net_send=summary['net_send'],
                                            net_recv=summary['net_recv'],
                                            net_send_avg=summary['net_send_avg'], net_recv_avg=summary['net_recv_avg'],
@@ -351,6 +382,20 @@ class File:
             with open(path, 'a+', encoding="utf-8") as file:
                 file.write(f'{log_time}={str(value)}' + '\n')
 
+    def add_record(self, path, log_time, record):
+        """Append a structured sample as time=json"""
+        with open(path, 'a+', encoding="utf-8") as file:
+            file.write(f'{log_time}={json.dumps(record)}' + '\n')
+
+    def readRecord(self, scene, filename):
+        """Read a log written by add_record"""
+        record_list = list()
+        if os.path.exists(os.path.join(self.report_dir, scene, filename)):
+            for line in self.open_file(os.path.join(self.report_dir, scene, filename), "r"):
+                log_time, record = line.split('=', 1)
+                record_list.append({"x": log_time.strip(), "y": json.loads(record)})
+        return record_list
+
     def record_net(self, type, send, recv):
         net_dict = {}
         match (type):
@@ -443,6 +488,13 @@ class File:
         # print(result)
         return result
 
+    def getCpuCoreLog(self, platform, scene, corenum):
+        targetDic = {}
+        for i in range(int(corenum)):
+            targetDic['cpuCore_{}'.format(i)] = self.readLog(scene=scene, filename='cpu_core_{}.log'.format(i))[0]
+        result = {'status': 1, 'cpuCore': targetDic}
+        return result
+
     def getCpuLogCompare(self, platform, scene1, scene2):
         targetDic = {}
         targetDic['scene1'] = self.readLog(scene=scene1, filename='cpu_app.log')[0]
@@ -453,7 +505,30 @@ class File:
     def getGpuLog(self, platform, scene):
         targetDic = {}
         targetDic['gpu'] = self.readLog(scene=scene, filename='gpu.log')[0]
-        result = {'status': 1, 'gpu': targetDic['gpu']}
+        targetDic['gpuFreq'] = self.readLog(scene=scene, filename='gpu_freq.log')[0]
+        result = {'status': 1, 'gpu': targetDic['gpu'], 'gpuFreq': targetDic['gpuFreq']}
+        return result
+
+    def getFrameStatsLog(self, platform, scene):
+        targetDic = {}
+        for name in ['p50', 'p90', 'p95', 'p99', 'input', 'animation', 'traversal', 'draw', 'sync', 'gpu']:
+            targetDic[name] = self.readLog(scene=scene, filename='frame_{}.log'.format(name))[0]
+        result = {'status': 1, 'frameStats': targetDic}
+        return result
+
+    def getSnapshotLog(self, platform, scene):
+        """rows of a snapshot run, every metric of a row was sampled in the same tick"""
+        result = {'status': 1, 'snapshot': self.readRecord(scene=scene, filename='snapshot.log')}
+        return result
+
+    def getThermalLog(self, platform, scene):
+        targetDic = {}
+        scene_dir = os.path.join(self.report_dir, scene)
+        if os.path.exists(scene_dir):
+            for filename in sorted(os.listdir(scene_dir)):
+                if filename.startswith('thermal_') and filename.endswith('.log'):
+                    targetDic[filename[len('thermal_'):-len('.log')]] = self.readLog(scene=scene, filename=filename)[0]
+        result = {'status': 1, 'thermal': targetDic, 'cooling': self.readRecord(scene=scene, filename='cooling.log')}
         return result
 
     def getGpuLogCompare(self, platform, scene1, scene2):
@@ -499,9 +574,13 @@ class File:
         if platform == Platform.Android:
             targetDic['batteryLevel'] = self.readLog(scene=scene, filename='battery_level.log')[0]
             targetDic['batteryTem'] = self.readLog(scene=scene, filename='battery_tem.log')[0]
+            targetDic['batteryPower'] = self.readLog(scene=scene, filename='battery_power.log')[0]
+            targetDic['batteryEnergy'] = self.readLog(scene=scene, filename='battery_energy.log')[0]
             result = {'status': 1,
                       'batteryLevel': targetDic['batteryLevel'],
-                      'batteryTem': targetDic['batteryTem']}
+                      'batteryTem': targetDic['batteryTem'],
+                      'batteryPower': targetDic['batteryPower'],
+                      'batteryEnergy': targetDic['batteryEnergy']}
         else:
             targetDic['batteryTem'] = self.readLog(scene=scene, filename='battery_tem.log')[0]
             targetDic['batteryCurrent'] = self.readLog(scene=scene, filename='battery_current.log')[0]
@@ -606,8 +685,10 @@ class File:
             cpuAppRate, cpuSystemRate = 0, 0
 
         for i in range(int(corenum)):
-            cpuFreqData = self.readLog(scene=scene, filename=f'cpu_core_{i}.log')[1]
+            cpuFreqData = self.readLog(scene=scene, filename=f'cpu_freq_{i}.log')[1]
             apm_dict['cpuFreq_{}'.format(i)] = cpuFreqData
+            cpuCoreData = self.readLog(scene=scene, filename=f'cpu_core_{i}.log')[1]
+            apm_dict['cpuCore_{}'.format(i)] = cpuCoreData
         gpuData = self.readLog(scene=scene, filename='gpu.log')[1]
         if gpuData.__len__() > 0:
             gpu = f'{round(sum(gpuData) / len(gpuData), 2)}%'
@@ -624,6 +705,13 @@ class File:
             batteryTemlMax = f'{batteryTemlDataSort[-1]}°C'
         else:
             batteryLevel, batteryTeml, batteryTemlAvg, batteryTemlMax = 0, 0, 0, 0
+        batteryPowerData = self.readLog(scene=scene, filename=f'battery_power.log')[1]
+        batteryEnergyData = self.readLog(scene=scene, filename=f'battery_energy.log')[1]
+        if batteryPowerData.__len__() > 0:
+            batteryPowerAvg = f'{round(sum(batteryPowerData) / len(batteryPowerData), 2)}mW'
+        else:
+            batteryPowerAvg = 0
+        batteryEnergy = f'{round(batteryEnergyData[-1], 3)}mWh' if batteryEnergyData.__len__() > 0 else 0
 
         totalPassData = self.readLog(scene=scene, filename=f'mem_total.log')[1]
         totalPassData.sort()
@@ -734,6 +822,8 @@ class File:
         apm_dict['batteryTeml'] = batteryTeml
         apm_dict['batteryTemlMax'] = batteryTemlMax
         apm_dict['batteryTemlAvg'] = batteryTemlAvg
+        apm_dict['batteryPowerAvg'] = batteryPowerAvg
+        apm_dict['batteryEnergy'] = batteryEnergy
         apm_dict['mem_detail_flag'] = mem_detail_flag
 
         return apm_dict
@@ -0,0 +1,171 @@
+#!/usr/bin/python
+# encoding=utf-8
+
+"""
+@Desc    :  start/stop switch of the monitoring sessions. The switch is an in-memory event,
+            while a session collects continuously it also listens on a local socket so another process can stop it.
+"""
+import os
+import re
+import secrets
+import socket
+import tempfile
+import threading
+from contextlib import contextmanager
+from logzero import logger
+
+CONTROL_DIR = os.path.join(tempfile.gettempdir(), 'solox-control')
+
+
+class RunControl(object):
+    """Run switch of one session, by name"""
+    HOST = '127.0.0.1'
+    _instances = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, session='default'):
+        with cls._lock:
+            if session not in cls._instances:
+                cls._instances[session] = cls(session)
+            return cls._instances[session]
+
+    @classmethod
+    def status_all(cls):
+        """'on' while any session of this process runs"""
+        with cls._lock:
+            controls = list(cls._instances.values())
+        return 'on' if any(control.running() for control in controls) else 'off'
+
+    @staticmethod
+    def filename(session):
+        return '{}.port'.format(re.sub(r'[^\w.-]', '_', session))
+
+    @classmethod
+    def stop_all(cls, session=None):
+        """
+        Stop the sessions of this process and the ones other processes listen for
+        :param session: only this session, None stops them all
+        """
+        with cls._lock:
+            controls = [control for name, control in cls._instances.items() if session in (None, name)]
+        for control in controls:
+            control.stop()
+        stopped = len(controls)
+        if not os.path.exists(CONTROL_DIR):
+            return stopped
+        for filename in os.listdir(CONTROL_DIR):
+            # port files are named after the sanitized session
+            if not filename.endswith('.port') or session is not None and filename != cls.filename(session):
+                continue
+            path = os.path.join(CONTROL_DIR, filename)
+            try:
+                with open(path, 'r') as file:
+                    port, token = file.read().split()
+                with socket.create_connection((cls.HOST, int(port)), timeout=2) as sock:
+                    sock.sendall('stop {}\n'.format(token).encode('utf-8'))
+                stopped += 1
+            except (OSError, ValueError):
+                # the process that owned it is gone
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return stopped
+
+    def __init__(self, session='default'):
+        self.session = session
+        self.stopped = threading.Event()
+        self.stopped.set()
+        self.token = None
+        self.server = None
+        self.thread = None
+        self.closing = threading.Event()
+        # collect loops currently holding the listener open
+        self.listeners = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port_file(self):
+        return os.path.join(CONTROL_DIR, self.filename(self.session))
+
+    def status(self):
+        return 'off' if self.stopped.is_set() else 'on'
+
+    def running(self):
+        return not self.stopped.is_set()
+
+    def wait(self, timeout=None):
+        """Sleep up to timeout seconds, return True as soon as the session is stopped"""
+        return self.stopped.wait(timeout)
+
+    def start(self):
+        self.stopped.clear()
+        return self
+
+    def stop(self):
+        if not self.stopped.is_set():
+            self.stopped.set()
+            logger.info('stop solox success: {}'.format(self.session))
+        return True
+
+    @contextmanager
+    def listening(self):
+        """Accept stop requests from other processes for as long as the block runs"""
+        with self.lock:
+            self.listeners += 1
+            if self.listeners == 1:
+                try:
+                    self.listen()
+                except OSError as e:
+                    # the in-memory switch still works, only other processes cannot stop this session
+                    logger.warning(e)
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.listeners -= 1
+                if self.listeners == 0:
+                    self.close()
+
+    def close(self):
+        if self.thread is not None:
+            self.closing.set()
+            self.thread.join()
+            self.thread = None
+
+    def listen(self):
+        self.closing.clear()
+        self.token = secrets.token_hex(8)
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind((self.HOST, 0))
+        self.server.listen(4)
+        self.server.settimeout(0.5)
+        os.makedirs(CONTROL_DIR, exist_ok=True)
+        with open(self.port_file, 'w') as file:
+            file.write('{} {}'.format(self.server.getsockname()[1], self.token))
+        self.thread = threading.Thread(target=self.serve, name='solox-control-{}'.format(self.session))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        try:
+            while not self.closing.is_set():
+                try:
+                    conn, _ = self.server.accept()
+                except socket.timeout:
+                    continue
+                with conn:
+                    conn.settimeout(2)
+                    try:
+                        request = conn.recv(128).decode('utf-8', errors='replace').split()
+                    except OSError:
+                        continue
+                    if request == ['stop', self.token]:
+                        self.stop()
+        finally:
+            self.server.close()
+            try:
+                os.remove(self.port_file)
+            except OSError:
+                pass
@@ -0,0 +1,196 @@
+#!/usr/bin/python
+# encoding=utf-8
+
+"""
+@Desc    :  local fake adb server speaking the smart socket protocol,
+            used to exercise and benchmark AdbClient without a phone.
+            python -m solox.public.fakeadb
+"""
+import socketserver
+import struct
+import threading
+import time
+from solox.public.adbclient import AdbClient, ID_EXIT, ID_STDERR, ID_STDOUT
+
+
+def encode_string(text):
+    data = text.encode('utf-8')
+    return '{:04x}'.format(len(data)).encode('ascii') + data
+
+
+class FakeDevice(object):
+
+    def __init__(self, serial, commands=None, state='device', shell_v2=True):
+        """
+        :param commands: {cmd: stdout} or {cmd: (stdout, stderr, exit_code)} or a callable(cmd)
+        """
+        self.serial = serial
+        self.commands = commands or {}
+        self.state = state
+        self.shell_v2 = shell_v2
+
+    def run(self, cmd):
+        if callable(self.commands):
+            result = self.commands(cmd)
+        else:
+            result = self.commands.get(cmd, ('', '/system/bin/sh: {}: not found\n'.format(cmd), 127))
+        if isinstance(result, str):
+            result = (result, '', 0)
+        return result
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+
+    def read_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def read_request(self):
+        size = int(self.read_exact(4), 16)
+        return self.read_exact(size).decode('utf-8')
+
+    def okay(self, payload=None):
+        self.request.sendall(b'OKAY' + (encode_string(payload) if payload is not None else b''))
+
+    def fail(self, message):
+        self.request.sendall(b'FAIL' + encode_string(message))
+
+    def handle(self):
+        server = self.server.owner
+        try:
+            service = self.read_request()
+            if service == 'host:version':
+                self.okay('{:04x}'.format(server.version))
+            elif service in ('host:devices', 'host:devices-l'):
+                self.okay(server.device_list())
+            elif service == 'host:track-devices':
+                self.track(server)
+            elif service.startswith('host-serial:') and service.endswith(':features'):
+                device = server.devices.get(service[len('host-serial:'):-len(':features')])
+                if device is None:
+                    self.fail('device not found')
+                else:
+                    self.okay('shell_v2,cmd' if device.shell_v2 else 'cmd')
+            elif service.startswith('host:transport'):
+                self.transport(server, service)
+            else:
+                self.fail('unknown host service')
+        except ConnectionError:
+            pass
+
+    def track(self, server):
+        with server.changed:
+            self.okay(server.device_list())
+            generation = server.generation
+            while server.running:
+                server.changed.wait(0.5)
+                if server.generation != generation:
+                    generation = server.generation
+                    self.request.sendall(encode_string(server.device_list()))
+
+    def transport(self, server, service):
+        if service == 'host:transport-any':
+            device = next(iter(server.devices.values()), None)
+        else:
+            device = server.devices.get(service[len('host:transport:'):])
+        if device is None:
+            self.fail('device not found')
+            return
+        self.okay()
+        service = self.read_request()
+        if service.startswith('shell,v2,raw:') and device.shell_v2:
+            stdout, stderr, exit_code = device.run(service[len('shell,v2,raw:'):])
+            self.okay()
+            for packet_id, data in ((ID_STDOUT, stdout), (ID_STDERR, stderr)):
+                if data:
+                    data = data.encode('utf-8')
+                    self.request.sendall(struct.pack('<BI', packet_id, len(data)) + data)
+            self.request.sendall(struct.pack('<BIB', ID_EXIT, 1, exit_code))
+        elif service.startswith('shell:'):
+            stdout, stderr, exit_code = device.run(service[len('shell:'):])
+            self.okay()
+            self.request.sendall((stdout + stderr).encode('utf-8'))
+        else:
+            self.fail('unsupported service: {}'.format(service))
+
+
+class FakeAdbServer(object):
+
+    def __init__(self, devices=None, host='127.0.0.1', port=0, version=41):
+        self.devices = {device.serial: device for device in devices or []}
+        self.version = version
+        self.running = False
+        self.generation = 0
+        self.changed = threading.Condition()
+        self.server = socketserver.ThreadingTCPServer((host, port), FakeAdbHandler, bind_and_activate=True)
+        self.server.daemon_threads = True
+        self.server.owner = self
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def client(self):
+        return AdbClient(host=self.server.server_address[0], port=self.port)
+
+    def device_list(self):
+        return ''.join('{}\t{}\n'.format(serial, device.state) for serial, device in self.devices.items())
+
+    def add_device(self, device):
+        with self.changed:
+            self.devices[device.serial] = device
+            self.generation += 1
+            self.changed.notify_all()
+
+    def remove_device(self, serial):
+        with self.changed:
+            self.devices.pop(serial, None)
+            self.generation += 1
+            self.changed.notify_all()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        with self.changed:
+            self.changed.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def benchmark(rounds=500):
+    """Measure AdbClient round-trips against the fake server"""
+    stat = 'cpu  2255 34 2290 22625563 6290 127 456 0 0 0\n'
+    with FakeAdbServer([FakeDevice('emulator-5554', {'cat /proc/stat': stat})]) as server:
+        client = server.client()
+        result = {}
+        for name, call in (('host:devices', client.devices),
+                           ('shell,v2', lambda: client.shell('emulator-5554', 'cat /proc/stat'))):
+            call()
+            start = time.perf_counter()
+            for _ in range(rounds):
+                call()
+            result[name] = (time.perf_counter() - start) / rounds * 1000
+            print('{:<14} {:.3f} ms/call'.format(name, result[name]))
+        return result
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,233 @@
+#!/usr/bin/python
+# encoding=utf-8
+
+"""
+@Desc    :  vectorized frame analysis, gives the same jank/bigjank/jank time as
+            SurfaceStatsCollector._calculate_jankey_new on whole arrays at once, see tests/test_frame_analysis.py
+            python -m solox.public.frame_analysis
+"""
+import time
+import numpy as np
+
+# 2 and 3 frames of a 24 fps film, in seconds
+TWO_FILM_STAMP = 1000.0 / 24.0 * 2.0 / 1000
+THREE_FILM_STAMP = 1000.0 / 24.0 * 3.0 / 1000
+
+PENDING_FENCE_TIMESTAMP = (1 << 63) - 1
+# (stage, start column, end column) of dumpsys gfxinfo framestats
+FRAMESTATS_STAGES = (
+    ('input', 'HandleInputStart', 'AnimationStart'),
+    ('animation', 'AnimationStart', 'PerformTraversalsStart'),
+    ('traversal', 'PerformTraversalsStart', 'DrawStart'),
+    ('draw', 'DrawStart', 'SyncQueued'),
+    ('sync', 'SyncStart', 'IssueDrawCommandsStart'),
+    ('gpu', 'IssueDrawCommandsStart', 'FrameCompleted'),
+)
+PERCENTILES = (50, 90, 95, 99)
+
+
+def frame_intervals(vsync):
+    """time between consecutive frames, interval i ends at frame i + 1"""
+    vsync = np.asarray(vsync, dtype=np.float64)
+    return vsync[1:] - vsync[:-1]
+
+
+def jank_masks(vsync):
+    """
+    Classify every frame from the fifth on against twice the mean of its three previous intervals
+    :return: frame times, jank mask, big jank mask, all aligned on frames 4..n-1
+    """
+    intervals = frame_intervals(vsync)
+    frame_time = intervals[3:]
+    # same operation order as the loop: sum([d(i-1), d(i-2), d(i-3)]) / 3 * 2
+    rolling = (intervals[2:-1] + intervals[1:-2] + intervals[:-3]) / 3 * 2
+    slow = frame_time > rolling
+    bigjank = slow & (frame_time > THREE_FILM_STAMP)
+    jank = slow & ~bigjank & (frame_time > TWO_FILM_STAMP)
+    return frame_time, jank, bigjank
+
+
+def jank_stats(vsync, jank_threshold=0.166):
+    """
+    Jank count, big jank count and jank time of a run of frames
+    :param vsync: vsync timestamps in seconds
+    :param jank_threshold: seconds, only applies to the first four frames like the loop does
+    """
+    vsync = np.asarray(vsync, dtype=np.float64)
+    jank, bigjank, jank_time = 0, 0, 0
+    tempstamp = 0
+    # the first four frames are compared against the fixed threshold, one by one like the loop
+    for timestamp in vsync[:4].tolist():
+        if tempstamp == 0:
+            tempstamp = timestamp
+            continue
+        if timestamp - tempstamp > jank_threshold:
+            jank = jank + 1
+        tempstamp = timestamp
+    if len(vsync) > 4:
+        frame_time, jank_mask, bigjank_mask = jank_masks(vsync)
+        jank = jank + int(np.count_nonzero(jank_mask))
+        bigjank = int(np.count_nonzero(bigjank_mask))
+        janky = frame_time[jank_mask | bigjank_mask]
+        if len(janky):
+            # cumsum adds left to right like the loop, np.sum would pair the terms
+            jank_time = float(np.cumsum(janky)[-1])
+    return jank, bigjank, jank_time
+
+
+def parse_framestats(output):
+    """
+    Parse every column of dumpsys gfxinfo <pkg> framestats, by header name so extra columns do not shift the others
+    :return: {window: {column: int64 array}}, only valid frames (Flags == 0) whose vsync is not a pending fence
+    """
+    windows, window, header, rows = {}, None, None, []
+
+    def flush():
+        if window is None or header is None or not rows:
+            return
+        data = np.array(rows, dtype=np.int64)
+        data = data[data[:, header.index('Flags')] == 0]
+        if 'Vsync' in header:
+            data = data[data[:, header.index('Vsync')] != PENDING_FENCE_TIMESTAMP]
+        columns = {name: data[:, index] for index, name in enumerate(header)}
+        if window in windows:
+            columns = {name: np.concatenate([windows[window][name], values]) for name, values in columns.items()
+                       if name in windows[window]}
+        windows[window] = columns
+
+    for line in output.replace('\r\n', '\n').split('\n'):
+        line = line.strip()
+        if line.startswith('Window:'):
+            flush()
+            window, header, rows = line[len('Window:'):].strip(), None, []
+        elif '/android.view.ViewRootImpl@' in line:
+            # before android 10 the section title is <activity>/android.view.ViewRootImpl@<id> (visibility=0)
+            flush()
+            window, header, rows = line.split('/android.view.ViewRootImpl@')[0], None, []
+        elif line.startswith('Flags,'):
+            header = [name for name in line.split(',') if name]
+        elif line.startswith('---PROFILEDATA---'):
+            flush()
+            header, rows = None, []
+        elif header is not None and line[:1].isdigit():
+            fields = line.split(',')
+            if len(fields) >= len(header):
+                rows.append([int(field) for field in fields[:len(header)]])
+    flush()
+    return windows
+
+
+def concat_framestats(parts):
+    """join framestats column dicts, keeping the columns every part has"""
+    parts = [part for part in parts if part]
+    if not parts:
+        return {}
+    names = [name for name in parts[0] if all(name in part for part in parts)]
+    return {name: np.concatenate([part[name] for part in parts]) for name in names}
+
+
+def framestats_summary(columns):
+    """
+    Frame time percentiles and mean duration of each stage, unit:ms
+    :return: {'frames': n, 'p50': .., 'p90': .., 'p95': .., 'p99': .., 'input': .., ..., 'gpu': ..}, {} without frames
+    """
+    if not columns or not len(columns.get('IntendedVsync', ())):
+        return {}
+    completed = columns['FrameCompleted']
+    summary = {'frames': int(len(completed))}
+    frame_time = (completed - columns['IntendedVsync']) / 1e6
+    for percentile, value in zip(PERCENTILES, np.percentile(frame_time, PERCENTILES)):
+        summary['p{}'.format(percentile)] = round(float(value), 2)
+    for stage, start, end in FRAMESTATS_STAGES:
+        if start not in columns or end not in columns:
+            continue
+        end_time = columns[end]
+        if stage == 'gpu' and 'GpuCompleted' in columns:
+            # GpuCompleted is 0 when the renderer did not report it
+            end_time = np.where(columns['GpuCompleted'] > 0, columns['GpuCompleted'], end_time)
+        duration = np.clip((end_time - columns[start]) / 1e6, 0, None)
+        summary[stage] = round(float(duration.mean()), 2)
+    return summary
+
+
+def parse_timestats(output):
+    """
+    Parse the per-layer part of dumpsys SurfaceFlinger --timestats -dump
+    :return: [{'layerName': .., 'packageName': .., 'totalFrames': .., 'droppedFrames': ..,
+               'present2present': {ms: count}, ...}]
+    """
+    layers, layer, histogram = [], None, None
+    for line in output.replace('\r\n', '\n').split('\n'):
+        line = line.strip()
+        if line.startswith('layerName ='):
+            layer = {'layerName': line.split('=', 1)[1].strip()}
+            layers.append(layer)
+            histogram = None
+        elif layer is None:
+            continue
+        elif line.endswith('histogram is as below:'):
+            histogram = line.split()[0]
+            layer[histogram] = {}
+        elif histogram is not None and 'ms=' in line:
+            for bucket in line.split():
+                ms, _, count = bucket.partition('ms=')
+                if ms.isdigit() and count.isdigit():
+                    layer[histogram][int(ms)] = int(count)
+        elif ' = ' in line:
+            name, value = [part.strip() for part in line.split(' = ', 1)]
+            layer[name] = int(value) if value.isdigit() else value
+            histogram = None
+    return layers
+
+
+def histogram_stats(histogram):
+    """
+    FPS, jank, big jank and jank time of a present-to-present histogram {ms: count}.
+    The histogram has no frame order, so a frame is janky on its own duration only (2 and 3 film frames)
+    :return: fps, jank, bigjank, jank_time in seconds
+    """
+    if not histogram:
+        return 0, 0, 0, 0
+    ms = np.array(list(histogram.keys()), dtype=np.float64)
+    counts = np.array(list(histogram.values()), dtype=np.int64)
+    seconds = ms / 1000
+    total = float((seconds * counts).sum())
+    fps = round(int(counts.sum()) / total, 2) if total > 0 else 0
+    bigjank = seconds > THREE_FILM_STAMP
+    jank = ~bigjank & (seconds > TWO_FILM_STAMP)
+    jank_time = float((seconds * counts)[jank | bigjank].sum())
+    return fps, int(counts[jank].sum()), int(counts[bigjank].sum()), jank_time
+
+
+def synthetic_frames(frames=100000, seed=0):
+    """vsync-like timestamps at 60 Hz with occasional long frames"""
+    rng = np.random.default_rng(seed)
+    intervals = np.full(frames - 1, 1 / 60)
+    intervals += rng.normal(0, 0.001, frames - 1)
+    slow = rng.random(frames - 1) < 0.02
+    intervals[slow] *= rng.choice([2, 3, 5, 8], slow.sum())
+    return np.concatenate([[1000.0], 1000.0 + np.cumsum(np.abs(intervals))])
+
+
+def benchmark(frames=100000, rounds=5):
+    """Compare jank_stats with the per-frame loop of SurfaceStatsCollector on a long capture"""
+    from solox.public.android_fps import SurfaceStatsCollector
+    collector = SurfaceStatsCollector(None, 1, None, None, 166, True)
+    vsync = synthetic_frames(frames)
+    rows = [[0, timestamp, 0] for timestamp in vsync.tolist()]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        expected = collector._calculate_jankey_new(rows)
+    loop = (time.perf_counter() - start) / rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = jank_stats(vsync, collector.jank_threshold)
+    vectorized = (time.perf_counter() - start) / rounds
+    assert result == expected, '{} != {}'.format(result, expected)
+    print('{} frames: loop {:.2f} ms, numpy {:.2f} ms, x{:.0f}'.format(
+        frames, loop * 1000, vectorized * 1000, loop / vectorized))
+    return loop, vectorized
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,167 @@
+#!/usr/bin/python
+# encoding=utf-8
+
+"""
+@Desc    :  batch many device reads into one shell round-trip per sampling tick.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from solox.public.adb import adb
+
+MARKER = '__SOLOX_PROBE__'
+
+
+class Snapshot(object):
+    """Outputs of one batched read, all taken at the same moment"""
+
+    def __init__(self, values, timestamp, monotonic):
+        self.values = values
+        self.timestamp = timestamp
+        self.monotonic = monotonic
+
+    def get(self, name, default=''):
+        return self.values.get(name, default)
+
+    def __contains__(self, name):
+        return name in self.values
+
+
+class ProbeBatch(object):
+    """Named shell reads concatenated into one delimited command"""
+
+    def __init__(self, deviceId, probes=None):
+        self.deviceId = deviceId
+        self.probes = dict(probes or {})
+
+    def add(self, name, cmd):
+        self.probes[name] = cmd
+        return self
+
+    def discard(self, name):
+        self.probes.pop(name, None)
+
+    def command(self):
+        return '\n'.join('echo {}{}\n{}\necho'.format(MARKER, name, cmd) for name, cmd in self.probes.items())
+
+    @staticmethod
+    def parse(output):
+        """Split the batched output back per probe"""
+        values = {}
+        name, lines = None, []
+        for line in output.splitlines():
+            if line.startswith(MARKER):
+                if name is not None:
+                    values[name] = '\n'.join(lines).strip()
+                name, lines = line[len(MARKER):].strip(), []
+            elif name is not None:
+                lines.append(line)
+        if name is not None:
+            values[name] = '\n'.join(lines).strip()
+        return values
+
+    def run(self, timeout=None):
+        timestamp, monotonic = time.time(), time.monotonic()
+        if not self.probes:
+            return Snapshot({}, timestamp, monotonic)
+        output = adb.shell(cmd=self.command(), deviceId=self.deviceId, timeout=timeout)
+        return Snapshot(self.parse(output), timestamp, monotonic)
+
+
+class DeviceProbes(object):
+    """Per-device registry of the reads every sampler contributes, batched per sampler or per tick"""
+    TICK = 0.2
+    _instances = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, deviceId):
+        with cls._lock:
+            if deviceId not in cls._instances:
+                cls._instances[deviceId] = cls(deviceId)
+            return cls._instances[deviceId]
+
+    @classmethod
+    def clear_all(cls):
+        with cls._lock:
+            cls._instances.clear()
+
+    def __init__(self, deviceId):
+        self.deviceId = deviceId
+        self.batch = ProbeBatch(deviceId)
+        # name: Snapshot the probe was last read in
+        self.reads = {}
+        # Snapshot serving every read of a tick() block
+        self.pinned = None
+        # {name: cmd, or None to unregister} changes waiting for the end of a pinned tick
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, cmd):
+        with self.lock:
+            if self.pinned is not None:
+                # the pinned read must serve the whole tick, new probes join the next one
+                if self.batch.probes.get(name) != cmd or name in self.pending:
+                    self.pending[name] = cmd
+            elif self.batch.probes.get(name) != cmd:
+                self.batch.add(name, cmd)
+                self.reads.pop(name, None)
+        return self
+
+    def unregister(self, name):
+        with self.lock:
+            if self.pinned is not None:
+                self.pending[name] = None
+            else:
+                self.batch.discard(name)
+                self.reads.pop(name, None)
+
+    def snapshot(self, max_age=None, names=None):
+        """
+        Read probes in one round-trip, reusing their last read if it is recent enough.
+        Only the probes a sampler asks for are read, so each probe follows the cadence of its sampler
+        :param max_age: seconds a previous read stays valid, 0 forces a new read
+        :param names: probes read together and sharing one timestamp, None reads every registered probe
+        """
+        max_age = self.TICK if max_age is None else max_age
+        with self.lock:
+            if self.pinned is not None:
+                return self.pinned
+            names = list(self.batch.probes) if names is None else [name for name in names if name in self.batch.probes]
+            last = self.reads.get(names[0]) if names else None
+            # the group is reused only when all of it came from the same read
+            if last is None or any(self.reads.get(name) is not last for name in names) \
+                    or time.monotonic() - last.monotonic >= max_age:
+                last = ProbeBatch(self.deviceId, {name: self.batch.probes[name] for name in names}).run()
+                for name in names:
+                    self.reads[name] = last
+            return last
+
+    @contextmanager
+    def tick(self):
+        """
+        Serve every snapshot() of the block from one batched read of every probe, so the samplers see the same moment.
+        Probes registered inside the block are read from the next tick on
+        """
+        with self.lock:
+            self.pinned = self.batch.run()
+            for name in self.batch.probes:
+                self.reads[name] = self.pinned
+        try:
+            yield self.pinned
+        finally:
+            with self.lock:
+                self.pinned = None
+                for name, cmd in self.pending.items():
+                    if cmd is None:
+                        self.batch.discard(name)
+                        self.reads.pop(name, None)
+                    elif self.batch.probes.get(name) != cmd:
+                        self.batch.add(name, cmd)
+                        self.reads.pop(name, None)
+                self.pending.clear()
+
+    def read(self, name, cmd, max_age=None):
+        """Register a probe if needed and return its latest output"""
+        self.register(name, cmd)
+        return self.snapshot(max_age, names=[name]).get(name)
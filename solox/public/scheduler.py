@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# encoding=utf-8
+
+"""
+@Desc    :  one sampling loop per device, metrics run on their own interval from a timer wheel
+            and execute in a small thread pool sharing the adb shell session and the pid cache.
+"""
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logzero import logger
+
+
+class TimerWheel(object):
+    """Hashed timer wheel, a timer lands in the slot of its deadline and waits there for its remaining rounds"""
+
+    def __init__(self, resolution=0.1, slots=64, start=None):
+        self.resolution = resolution
+        self.slots = [[] for _ in range(slots)]
+        self.cursor = 0
+        self.tick_time = time.monotonic() if start is None else start
+
+    def add(self, item, delay):
+        ticks = max(1, math.ceil(delay / self.resolution))
+        slot = (self.cursor + ticks) % len(self.slots)
+        self.slots[slot].append([(ticks - 1) // len(self.slots), item])
+
+    def next_tick(self):
+        return self.tick_time + self.resolution
+
+    def advance(self, now):
+        """Move the cursor up to now and return the items that became due"""
+        due = []
+        while self.next_tick() <= now:
+            self.tick_time += self.resolution
+            self.cursor = (self.cursor + 1) % len(self.slots)
+            waiting = []
+            for entry in self.slots[self.cursor]:
+                if entry[0] == 0:
+                    due.append(entry[1])
+                else:
+                    entry[0] -= 1
+                    waiting.append(entry)
+            self.slots[self.cursor] = waiting
+        return due
+
+
+# keys naming an entry rather than measuring it, list entries carrying one are matched by it
+IDENTIFIERS = ('tid', 'pid', 'uid', 'core')
+
+
+def flatten(reading, prefix=''):
+    """{path: number} of every numeric value of a nested reading, identifiers left out"""
+    values = {}
+    if isinstance(reading, dict):
+        for key, value in reading.items():
+            if key not in IDENTIFIERS:
+                values.update(flatten(value, '{}{}.'.format(prefix, key)))
+    elif isinstance(reading, (list, tuple)):
+        for index, value in enumerate(reading):
+            # top-N lists reorder between readings, key their entries by id instead of position
+            ids = [value[key] for key in IDENTIFIERS if isinstance(value, dict) and key in value]
+            values.update(flatten(value, '{}{}.'.format(prefix, ids[0] if ids else index)))
+    elif isinstance(reading, (int, float)) and not isinstance(reading, bool):
+        values[prefix[:-1]] = float(reading)
+    return values
+
+
+class AdaptivePolicy(object):
+    """Back a sampler off while its readings are stable, burst back to min_interval when they move"""
+
+    def __init__(self, min_interval=0.5, max_interval=5.0, change=0.1, floor=1.0, backoff=1.5, thresholds=None,
+                 ignore=()):
+        """
+        :param change: relative change of any value that counts as a move
+        :param floor: values smaller than this are compared in absolute terms, so noise around 0 stays stable
+        :param thresholds: {value path: level}, crossing a level in either direction counts as a move
+        :param ignore: value paths that always change, like a timestamp, a path also ignores the values nested under it
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.change = change
+        self.floor = floor
+        self.backoff = backoff
+        self.thresholds = thresholds or {}
+        self.ignore = set(ignore)
+
+    def ignored(self, path):
+        return any(path == ignore or path.startswith(ignore + '.') for ignore in self.ignore)
+
+    def moved(self, previous, current):
+        for path, value in current.items():
+            if path not in previous or self.ignored(path):
+                continue
+            if abs(value - previous[path]) > self.change * max(abs(previous[path]), self.floor):
+                return True
+            level = self.thresholds.get(path)
+            if level is not None and (previous[path] < level) != (value < level):
+                return True
+        return False
+
+    def next(self, interval, previous, current):
+        """Interval until the next reading, given the last two readings"""
+        if previous is None or self.moved(flatten(previous), flatten(current)):
+            return self.min_interval
+        return min(self.max_interval, max(self.min_interval, interval * self.backoff))
+
+
+class SamplingJob(object):
+
+    def __init__(self, name, sample, interval, policy=None):
+        self.name = name
+        self.sample = sample
+        self.policy = policy
+        self.interval = policy.min_interval if policy else interval
+        self.running = False
+        self.result = None
+        self.runs = 0
+
+    def __call__(self):
+        try:
+            result = self.sample()
+            if self.policy:
+                self.interval = self.policy.next(self.interval, self.result, result)
+            self.result = result
+            logger.info(f'{self.name}: {self.result}')
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            self.runs += 1
+            self.running = False
+
+
+class SamplingScheduler(object):
+    """Run the metric samplers of one device in a single process"""
+
+    def __init__(self, deviceId, workers=4, resolution=0.1, stopped=None):
+        """
+        :param stopped: threading.Event ending the run when set, e.g. the one of a RunControl
+        """
+        self.deviceId = deviceId
+        self.workers = workers
+        self.resolution = resolution
+        self.jobs = {}
+        self.stopped = stopped or threading.Event()
+
+    def add(self, name, sample, interval=1.0, policy=None):
+        """
+        :param sample: callable taking no argument, returns the latest reading of the metric
+        :param interval: seconds between two starts of the sampler
+        :param policy: AdaptivePolicy moving the interval between its bounds, replaces interval
+        """
+        self.jobs[name] = SamplingJob(name, sample, interval, policy)
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self, status=None, duration=0):
+        """
+        Sample until status() is no longer 'on', stop() is called or duration seconds have passed
+        :return: {name: last reading}
+        """
+        end_time = time.monotonic() + duration if duration > 0 else None
+        wheel = TimerWheel(self.resolution)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'solox-{self.deviceId}') as pool:
+            due = list(self.jobs.values())
+            while not self.stopped.is_set():
+                if status is not None and status() != 'on':
+                    break
+                if end_time is not None and time.monotonic() >= end_time:
+                    break
+                for job in due:
+                    # a sampler slower than its interval skips a beat instead of piling up
+                    if not job.running:
+                        job.running = True
+                        pool.submit(job)
+                    wheel.add(job, job.interval)
+                self.stopped.wait(max(0.0, wheel.next_tick() - time.monotonic()))
+                due = wheel.advance(time.monotonic())
+        return {name: {} if job.result is None else job.result for name, job in self.jobs.items()}
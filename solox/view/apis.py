@@ -7,9 +7,10 @@ from flask import request, make_response
 from logzero import logger
 from flask import Blueprint
 from solox import __version__
-from solox.public.apm import CPU, Memory, Network, FPS, Battery, GPU, Target, Singleton
+from solox.public.apm import CPU, Memory, Network, FPS, Battery, GPU, Thermal, Target, Singleton
 from solox.public.apm_pk import CPU_PK, MEM_PK, Flow_PK, FPS_PK
-from solox.public.common import Devices, File, Method, Install, Platform, Scrcpy
+from solox.public.common import Devices, File, Method, Install, PidCache, Platform, Scrcpy
+from solox.public.probe import DeviceProbes
 
 d = Devices()
 f = File()
@@ -206,9 +207,10 @@ def getCpuRate():
                 process = method._request(request, 'process')
                 pid = None
                 deviceId = d.getIdbyDevice(device, platform)
-                if process and platform == Platform.Android:
+                aggregate = process == 'all'
+                if process and platform == Platform.Android and not aggregate:
                     pid = process.split(':')[0]
-                cpu = CPU(pkgName=pkgname, deviceId=deviceId, platform=platform, pid=pid)
+                cpu = CPU(pkgName=pkgname, deviceId=deviceId, platform=platform, pid=pid, aggregate=aggregate)
                 appCpuRate, systemCpuRate = cpu.getCpuRate()
                 result = {'status': 1, 'appCpuRate': appCpuRate, 'systemCpuRate': systemCpuRate}
     except Exception as e:
@@ -285,9 +287,10 @@ def getMemory():
                 process = method._request(request, 'process')
                 pid = None
                 deviceId = d.getIdbyDevice(device, platform)
-                if process and platform == Platform.Android:
+                aggregate = process == 'all'
+                if process and platform == Platform.Android and not aggregate:
                     pid = process.split(':')[0]
-                mem = Memory(pkgName=pkgname, deviceId=deviceId, platform=platform, pid=pid)
+                mem = Memory(pkgName=pkgname, deviceId=deviceId, platform=platform, pid=pid, aggregate=aggregate)
                 totalPass, swapPass = mem.getProcessMemory()
                 result = {'status': 1, 'totalPass': totalPass, 'swapPass': swapPass}
     except Exception as e:
@@ -388,8 +391,10 @@ def getFps():
     pkgname = method._request(request, 'pkgname')
     device = method._request(request, 'device')
     surv = method._request(request, 'surv')
+    timestats = method._request(request, 'timestats')
     try:
         surfaceview = False if surv == 'false' else True
+        timestats = True if timestats == 'true' else False
         match(model):
             case '2-devices':
                 pkgNameList = []
@@ -408,7 +413,8 @@ def getFps():
                 result = {'status': 1, 'first': first, 'second': second}
             case _:
                 deviceId = d.getIdbyDevice(device, platform)
-                fps_monitor = FPS.getObject(pkgName=pkgname, deviceId=deviceId, surfaceview=surfaceview, platform=platform)
+                fps_monitor = FPS.getObject(pkgName=pkgname, deviceId=deviceId, surfaceview=surfaceview, platform=platform,
+                                            timestats=timestats)
                 fps, jank, bigjank, Stutter = fps_monitor.getFPS()
                 Stutter = round((Stutter*100), 3)
                 result = {'status': 1, 'fps': fps, 'jank': jank, 'bigjank': bigjank, 'Stutter': Stutter}
@@ -449,7 +455,8 @@ def getGpu():
     platform = method._request(request, 'platform')
     # print(platform)
     try:
-        gpu = GPU(pkgName=pkgname, deviceId=device, platform=platform)
+        deviceId = d.getIdbyDevice(device, platform)
+        gpu = GPU(pkgName=pkgname, deviceId=deviceId, platform=platform)
         final = gpu.getGPU()
         # print(final)
         result = {'status': 1, 'gpu': final}
@@ -490,6 +497,13 @@ def makeReport():
         result = {'status': 1}
         FPS.clear_up_first_time()
         Singleton.clear_all_instances()
+        DeviceProbes.clear_all()
+        CPU.clear()
+        Memory.clear()
+        Network.clear()
+        GPU.clear()
+        Thermal.clear()
+        PidCache.clear_all()
     except Exception as e:
         logger.exception(e)
         result = {'status': 0, 'msg': str(e)}
@@ -644,11 +658,15 @@ def getLogData():
         fucDic = {
             'cpu': f.getCpuLog(platform, scene),
             'cpufreq': f.getCpuFreqLog(platform, scene, corenum),
+            'cpucore': f.getCpuCoreLog(platform, scene, corenum),
             'mem': f.getMemLog(platform, scene),
             'mem_detail': f.getMemDetailLog(platform, scene),
             'battery': f.getBatteryLog(platform, scene),
             'flow': f.getFlowLog(platform, scene),
             'fps': f.getFpsLog(platform, scene),
+            'framestats': f.getFrameStatsLog(platform, scene),
+            'thermal': f.getThermalLog(platform, scene),
+            'snapshot': f.getSnapshotLog(platform, scene),
             'gpu': f.getGpuLog(platform, scene)
         }
         result = fucDic[target]
@@ -728,6 +746,13 @@ def apmCollect():
                 cpu = CPU(pkgName=pkgname, deviceId=deviceid, platform=platform)
                 appCpuRate, systemCpuRate = cpu.getCpuRate(noLog=True)
                 result = {'status': 1, 'appCpuRate': appCpuRate, 'systemCpuRate': systemCpuRate}
+            case Target.CPUThread:
+                if platform == Platform.Android:
+                    cpu = CPU(pkgName=pkgname, deviceId=deviceid, platform=platform)
+                    threads = cpu.getAndroidThreadCpu(noLog=True)
+                    result = {'status': 1, 'threads': threads}
+                else:
+                    result = {'status': 0, 'msg': 'not support ios'}
             case Target.CPUFreq:
                 cpu = CPU(pkgName=pkgname, deviceId=deviceid, platform=platform)
                 cpuFreq = cpu.getCpuFreq(noLog=True)
@@ -749,7 +774,7 @@ def apmCollect():
                 result = {'status': 1, 'upflow': data[0], 'downflow': data[1]}
             case Target.FPS:
                 fps_monitor = FPS(pkgName=pkgname, deviceId=deviceid, platform=platform)
-                fps, jank, bigjank = fps_monitor.getFPS(noLog=True)
+                fps, jank, bigjank, Stutter = fps_monitor.getFPS(noLog=True)
                 result = {'status': 1, 'fps': fps, 'jank': jank, 'bigjank' : bigjank}
             case Target.Battery:
                 battery_monitor = Battery(deviceId=deviceid)
@@ -758,8 +783,12 @@ def apmCollect():
                     result = {'status': 1, 'level': final[0], 'temperature': final[1]}
                 else:
                     result = {'status': 1, 'temperature': final[0], 'current': final[1], 'voltage': final[2], 'power': final[3]}
+            case Target.Thermal:
+                thermal = Thermal(deviceId=deviceid, platform=platform)
+                temperatures, cooling = thermal.getThermal(noLog=True)
+                result = {'status': 1, 'thermal': temperatures, 'cooling': cooling}
             case Target.GPU:
-                gpu = GPU(pkgname=pkgname, deviceId=deviceid, platform=platform)
+                gpu = GPU(pkgName=pkgname, deviceId=deviceid, platform=platform)
                 final = gpu.getGPU(noLog=True)
                 if final != None:
                     result = {'status': 1, 'gpu': final}
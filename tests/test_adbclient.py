@@ -0,0 +1,74 @@
+import pytest
+
+from solox.public.adbclient import AdbClient, AdbError
+from solox.public.fakeadb import FakeAdbServer, FakeDevice
+
+
+@pytest.fixture(scope='module')
+def server():
+    devices = [
+        FakeDevice('emulator-5554', {
+            'cat /proc/loadavg': '0.52 0.58 0.59 1/1024 4242\n',
+            'ls /missing': ('', 'ls: /missing: No such file or directory\n', 1),
+        }),
+        FakeDevice('192.168.1.7:5555', {'getprop ro.build.version.sdk': '23\n'}, shell_v2=False),
+        FakeDevice('R58M123ABC', state='unauthorized'),
+    ]
+    with FakeAdbServer(devices) as fake:
+        yield fake
+
+
+def test_version(server):
+    client = server.client()
+    assert client.version() == 41
+    assert client.available() is True
+
+
+def test_unavailable():
+    with FakeAdbServer() as fake:
+        port = fake.port
+    assert AdbClient(port=port, timeout=1).available() is False
+
+
+def test_devices(server):
+    assert server.client().devices() == [('emulator-5554', 'device'), ('192.168.1.7:5555', 'device'),
+                                         ('R58M123ABC', 'unauthorized')]
+
+
+def test_parse_devices():
+    text = 'emulator-5554\tdevice\n\nR58M123ABC\toffline\ngarbage\n'
+    assert AdbClient.parse_devices(text) == [('emulator-5554', 'device'), ('R58M123ABC', 'offline')]
+
+
+def test_shell_v2(server):
+    result = server.client().shell('emulator-5554', 'cat /proc/loadavg')
+    assert result.exit_code == 0
+    assert result.stdout == '0.52 0.58 0.59 1/1024 4242\n'
+    assert result.stderr == ''
+
+
+def test_shell_v2_stderr(server):
+    result = server.client().shell('emulator-5554', 'ls /missing')
+    assert result.exit_code == 1
+    assert result.stdout == ''
+    assert result.stderr == 'ls: /missing: No such file or directory\n'
+
+
+def test_shell_v2_not_found(server):
+    result = server.client().shell('emulator-5554', 'top')
+    assert result.exit_code == 127
+    assert 'not found' in result.stderr
+
+
+def test_shell_legacy(server):
+    result = server.client().shell('192.168.1.7:5555', 'getprop ro.build.version.sdk')
+    assert result.exit_code is None
+    assert result.stdout == '23\n'
+
+
+def test_unknown_serial(server):
+    client = server.client()
+    with pytest.raises(AdbError, match='device not found'):
+        client.shell('0123456789', 'echo hi')
+    with pytest.raises(AdbError, match='device not found'):
+        client.transport('0123456789')
@@ -0,0 +1,65 @@
+import ast
+import functools
+import os
+import types
+import warnings
+
+import pytest
+
+from solox.public import frame_analysis
+
+FRAME = 1 / 60
+
+
+def vsync(intervals, start=100.0):
+    timestamps = [start]
+    for interval in intervals:
+        timestamps.append(timestamps[-1] + interval)
+    return timestamps
+
+
+# (vsync timestamps, jank, bigjank) the loop of SurfaceStatsCollector._calculate_jankey_new gives
+CASES = {
+    'empty': ([], 0, 0),
+    'single': ([100.0], 0, 0),
+    'steady': (vsync([FRAME] * 30), 0, 0),
+    'jank': (vsync([FRAME] * 6 + [0.1] + [FRAME] * 6), 1, 0),
+    'bigjank': (vsync([FRAME] * 6 + [0.15] + [FRAME] * 6), 0, 1),
+    'both': (vsync([FRAME] * 5 + [0.1] + [FRAME] * 5 + [0.2] + [FRAME] * 5), 1, 1),
+    'slow start': (vsync([0.2] + [FRAME] * 8), 1, 0),
+    'short': (vsync([0.3, FRAME]), 1, 0),
+    'back to back': (vsync([FRAME] * 4 + [0.1, 0.1, 0.1] + [FRAME] * 4), 2, 0),
+}
+
+
+@functools.lru_cache()
+def load_loop():
+    """the per-frame loop out of android_fps, without importing its adb dependencies"""
+    path = os.path.join(os.path.dirname(frame_analysis.__file__), 'android_fps.py')
+    with open(path, encoding='utf-8') as file, warnings.catch_warnings():
+        # android_fps has a few regex strings with invalid escapes
+        warnings.simplefilter('ignore')
+        tree = ast.parse(file.read())
+    collector = next(node for node in tree.body
+                     if isinstance(node, ast.ClassDef) and node.name == 'SurfaceStatsCollector')
+    method = next(node for node in collector.body
+                  if isinstance(node, ast.FunctionDef) and node.name == '_calculate_jankey_new')
+    namespace = {}
+    exec(compile(ast.Module(body=[method], type_ignores=[]), path, 'exec'), namespace)
+    return namespace['_calculate_jankey_new']
+
+
+@pytest.mark.parametrize('name', list(CASES))
+def test_jank_stats_matches_loop(name):
+    timestamps, jank, bigjank = CASES[name]
+    loop = load_loop()
+    expected = loop(types.SimpleNamespace(jank_threshold=0.166), [[0, timestamp, 0] for timestamp in timestamps])
+    assert frame_analysis.jank_stats(timestamps, 0.166) == expected
+    assert expected[:2] == (jank, bigjank)
+
+
+def test_jank_stats_matches_loop_on_long_capture():
+    timestamps = frame_analysis.synthetic_frames(5000).tolist()
+    loop = load_loop()
+    expected = loop(types.SimpleNamespace(jank_threshold=0.166), [[0, timestamp, 0] for timestamp in timestamps])
+    assert frame_analysis.jank_stats(timestamps, 0.166) == expected